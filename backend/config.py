@@ -2,7 +2,9 @@ import logging
 import os
 from dotenv import load_dotenv
 
-load_dotenv(override=True)
+# Variables already set in the environment (e.g. by the deploy platform)
+# take precedence over .env, so a stale file can't shadow production values
+load_dotenv(override=False)
 
 _log = logging.getLogger("sanad.config")
 
@@ -11,6 +13,7 @@ CLAUDE_MODEL = os.getenv("CLAUDE_MODEL", "claude-sonnet-4-20250514")
 EMBEDDING_MODEL = "paraphrase-multilingual-MiniLM-L12-v2"
 CHROMA_PERSIST_DIR = os.path.join(os.path.dirname(__file__), "chroma_db")
 ARTICLES_JSON_PATH = os.path.join(os.path.dirname(__file__), "data", "articles.json")
+ARTICLES_DB_PATH = os.path.join(os.path.dirname(__file__), "data", "articles.db")
 PDF_EXPLANATION_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "شرح نظام الأحوال الشخصية.pdf")
 PDF_REGULATIONS_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "pdf.pdf")
 
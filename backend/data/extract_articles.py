@@ -2,11 +2,17 @@
 استخراج المواد القانونية من كتاب شرح نظام الأحوال الشخصية
 وتحويلها إلى JSON منظم لاستخدامه في RAG Pipeline
 """
-import json
 import re
 import os
 import sys
-import PyPDF2
+from concurrent.futures import ProcessPoolExecutor
+import orjson
+import pypdfium2 as pdfium
+
+try:
+    import ahocorasick
+except ImportError:  # fall back to a single regex pass (see _build_matcher)
+    ahocorasick = None
 
 # Law structure based on table of contents analysis
 LAW_STRUCTURE = {
@@ -98,6 +104,73 @@ TOPIC_TAGS = {
     "ولاية": ["ولاية", "ولي", "عضل", "إذن"],
 }
 
+
+def _build_article_index() -> list[tuple | None]:
+    """Index LAW_STRUCTURE by article number → (bab_key, title, chapters)."""
+    index = [None] * 233
+    for bab_key, bab_info in LAW_STRUCTURE.items():
+        start, end = bab_info["article_range"]
+        for n in range(start, end + 1):
+            index[n] = (bab_key, bab_info["title"], bab_info["chapters"])
+    return index
+
+
+_ART2CHAP = _build_article_index()
+
+# Deadline keywords, in priority order (first listed wins)
+DEADLINE_KEYWORDS = [
+    "مهلة", "مدة", "خلال", "أيام", "أشهر", "شهر",
+    "سنة", "سنتين", "حيضات", "ثلاثين يوماً",
+    "عدة", "أربعة أشهر", "ثلاثة أشهر",
+]
+
+
+def _build_matcher(mapping: dict[str, tuple]):
+    """Compile a keyword → values mapping into a single-pass matcher.
+
+    The returned function yields the values tuple of every keyword
+    occurrence in the text, overlapping occurrences included.
+    """
+    if ahocorasick is not None:
+        automaton = ahocorasick.Automaton()
+        for kw, values in mapping.items():
+            automaton.add_word(kw, values)
+        automaton.make_automaton()
+        return lambda text: (values for _, values in automaton.iter(text))
+
+    # The lookahead reports the longest keyword starting at each position;
+    # every keyword that is a prefix of it matches there too, so merge
+    # their values up front.
+    merged = {
+        kw: tuple(v for other, values in mapping.items() if kw.startswith(other) for v in values)
+        for kw in mapping
+    }
+    alternation = "|".join(re.escape(kw) for kw in sorted(mapping, key=len, reverse=True))
+    pattern = re.compile(f"(?=({alternation}))")
+    return lambda text: (merged[kw] for kw in pattern.findall(text))
+
+
+def _keyword_topics() -> dict[str, tuple]:
+    """Invert TOPIC_TAGS — a keyword may belong to several topics (e.g. ولي)."""
+    inverted = {}
+    for topic, keywords in TOPIC_TAGS.items():
+        for kw in keywords:
+            inverted.setdefault(kw, []).append(topic)
+    return {kw: tuple(topics) for kw, topics in inverted.items()}
+
+
+# One pass over the text finds every topic keyword / deadline keyword
+_TOPIC_MATCHER = _build_matcher(_keyword_topics())
+_DEADLINE_MATCHER = _build_matcher(
+    {kw: ((rank, kw),) for rank, kw in enumerate(DEADLINE_KEYWORDS)}
+)
+
+# Article number references inside article text: المادة 5, للمادة (5), بالمادة 5
+_ARTICLE_REF = re.compile(r'(?:ب?المادة|للمادة)\s*\(?\s*(\d+)\s*\)?')
+
+# Sentence boundaries used when chunking long sections
+_SENT_SPLIT = re.compile(r'(?<=[.،؛:!؟\n])\s+')
+
 # Common deadlines in the law
 DEADLINE_ARTICLES = {
     95: "عدة الطلاق - ثلاث حيضات أو ثلاثة أشهر",
@@ -108,71 +181,85 @@ DEADLINE_ARTICLES = {
 }
 
 
-def extract_text_from_pdf(pdf_path: str) -> list[dict]:
-    """Extract text from all pages of a PDF."""
+def _extract_pages(pdf_path: str, lo: int, hi: int) -> list[dict]:
+    """Extract text from pages [lo, hi) — runs in a worker process."""
     pages = []
-    with open(pdf_path, "rb") as f:
-        reader = PyPDF2.PdfReader(f)
-        for i, page in enumerate(reader.pages):
-            text = page.extract_text()
+    pdf = pdfium.PdfDocument(pdf_path)
+    try:
+        for i in range(lo, hi):
+            page = pdf[i]
+            textpage = page.get_textpage()
+            text = textpage.get_text_range()
+            textpage.close()
+            page.close()
             if text:
                 pages.append({"page_number": i + 1, "text": text.strip()})
+    finally:
+        pdf.close()
     return pages
 
 
+def extract_text_from_pdf(pdf_path: str) -> list[dict]:
+    """Extract text from all pages of a PDF.
+
+    Pages are independent, so the document is split into one contiguous
+    page range per CPU and each range is extracted in its own process.
+    """
+    pdf = pdfium.PdfDocument(pdf_path)
+    n_pages = len(pdf)
+    pdf.close()
+
+    n_workers = min(os.cpu_count() or 1, n_pages)
+    if n_workers <= 1:
+        return _extract_pages(pdf_path, 0, n_pages)
+
+    step = -(-n_pages // n_workers)  # ceil division
+    pages = []
+    with ProcessPoolExecutor(max_workers=n_workers) as pool:
+        futures = [
+            pool.submit(_extract_pages, pdf_path, lo, min(lo + step, n_pages))
+            for lo in range(0, n_pages, step)
+        ]
+        for future in futures:
+            pages.extend(future.result())
+    return sorted(pages, key=lambda d: d["page_number"])
+
+
 def get_chapter_for_article(article_num: int) -> dict:
     """Determine the chapter and section for a given article number."""
-    for bab_key, bab_info in LAW_STRUCTURE.items():
-        start, end = bab_info["article_range"]
-        if start <= article_num <= end:
-            return {
-                "chapter": bab_key,
-                "chapter_title": bab_info["title"],
-                "sections": bab_info["chapters"],
-            }
+    entry = _ART2CHAP[article_num] if 0 <= article_num < len(_ART2CHAP) else None
+    if entry is not None:
+        bab_key, title, chapters = entry
+        return {"chapter": bab_key, "chapter_title": title, "sections": chapters}
     return {"chapter": "غير محدد", "chapter_title": "غير محدد", "sections": {}}
 
 
 def get_topic_tags(text: str) -> list[str]:
     """Extract topic tags from article text."""
-    tags = set()
-    for topic, keywords in TOPIC_TAGS.items():
-        for kw in keywords:
-            if kw in text:
-                tags.add(topic)
-                break
-    return list(tags)
+    return list({topic for topics in _TOPIC_MATCHER(text) for topic in topics})
 
 
 def get_related_articles(article_num: int, text: str) -> list[int]:
     """Find related article numbers mentioned in the text."""
     related = set()
     # Match Arabic article number references
-    patterns = [
-        r'المادة\s*\(?\s*(\d+)\s*\)?',
-        r'المادة\s+(\d+)',
-        r'للمادة\s*\(?\s*(\d+)\s*\)?',
-        r'بالمادة\s*\(?\s*(\d+)\s*\)?',
-    ]
-    for pattern in patterns:
-        matches = re.findall(pattern, text)
-        for m in matches:
-            num = int(m)
-            if num != article_num and 1 <= num <= 232:
-                related.add(num)
+    for m in _ARTICLE_REF.findall(text):
+        num = int(m)
+        if num != article_num and 1 <= num <= 232:
+            related.add(num)
     return sorted(list(related))
 
 
+def preview_text(text: str, max_chars: int = 300) -> str:
+    """Truncated text shown in the articles browser (/api/articles)."""
+    return text[:max_chars] + "..." if len(text) > max_chars else text
+
+
 def check_deadline(text: str) -> tuple[bool, str]:
     """Check if article contains deadline information."""
-    deadline_keywords = [
-        "مهلة", "مدة", "خلال", "أيام", "أشهر", "شهر",
-        "سنة", "سنتين", "حيضات", "ثلاثين يوماً",
-        "عدة", "أربعة أشهر", "ثلاثة أشهر",
-    ]
-    for kw in deadline_keywords:
-        if kw in text:
-            return True, kw
+    hits = [hit for found in _DEADLINE_MATCHER(text) for hit in found]
+    if hits:
+        return True, min(hits)[1]
     return False, ""
 
 
@@ -183,9 +270,7 @@ def build_articles_from_pages(pages: list[dict]) -> list[dict]:
     knowledge base from the full text.
     """
     articles = []
-
-    # Combine all text
-    full_text = "\n".join(p["text"] for p in pages)
+    pages_by_num = {p["page_number"]: p["text"] for p in pages}
 
     # Try to split by article patterns
     # Arabic numbers for articles: المادة الأولى, المادة الثانية, etc.
@@ -236,8 +321,9 @@ def build_articles_from_pages(pages: list[dict]) -> list[dict]:
     article_id = 0
     for topic, (start, end, bab, section) in page_ranges.items():
         # Extract text for this section
-        section_pages = [p for p in pages if start <= p["page_number"] <= end]
-        section_text = "\n".join(p["text"] for p in section_pages)
+        section_text = "\n".join(
+            pages_by_num[n] for n in range(start, end + 1) if n in pages_by_num
+        )
 
         if not section_text.strip():
             continue
@@ -256,6 +342,7 @@ def build_articles_from_pages(pages: list[dict]) -> list[dict]:
                 "id": f"chunk_{article_id}",
                 "chunk_index": i,
                 "text": chunk,
+                "text_preview": preview_text(chunk),
                 "chapter": bab,
                 "section": section,
                 "topic": topic,
@@ -277,7 +364,7 @@ def split_text_into_chunks(text: str, max_chars: int = 1500) -> list[str]:
     current = ""
 
     # Split by common sentence boundaries
-    sentences = re.split(r'(?<=[.،؛:!؟\n])\s+', text)
+    sentences = _SENT_SPLIT.split(text)
 
     for sentence in sentences:
         if not sentence.strip():
@@ -313,6 +400,7 @@ def extract_regulations(pdf_path: str) -> list[dict]:
             regulations.append({
                 "id": f"reg_{i+1}",
                 "text": chunk,
+                "text_preview": preview_text(chunk),
                 "chapter": "اللائحة التنفيذية",
                 "section": "لائحة نظام الأحوال الشخصية",
                 "topic": "لائحة تنفيذية",
@@ -325,6 +413,28 @@ def extract_regulations(pdf_path: str) -> list[dict]:
     return regulations
 
 
+def write_articles_json(output_path: str, header: dict, articles: list[dict]):
+    """Write {**header, "articles": articles} one article at a time.
+
+    Produces the same bytes as a single indented orjson dump, without
+    materializing the whole document in memory first.
+    """
+    if not articles:
+        with open(output_path, "wb") as f:
+            f.write(orjson.dumps({**header, "articles": []}, option=orjson.OPT_INDENT_2))
+        return
+
+    # Reuse the header object minus its closing "\n}", then open the array
+    head = orjson.dumps(header, option=orjson.OPT_INDENT_2)[:-2] + b"," if header else b"{"
+    with open(output_path, "wb") as f:
+        f.write(head + b'\n  "articles": [')
+        for i, article in enumerate(articles):
+            body = orjson.dumps(article, option=orjson.OPT_INDENT_2)
+            f.write(b",\n    " if i else b"\n    ")
+            f.write(body.replace(b"\n", b"\n    "))
+        f.write(b"\n  ]\n}")
+
+
 def main():
     """Main extraction pipeline."""
     script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -361,18 +471,24 @@ def main():
 
     # 3. Save to JSON
     output_path = os.path.join(script_dir, "articles.json")
-    with open(output_path, "w", encoding="utf-8") as f:
-        json.dump({
-            "total_chunks": len(all_articles),
-            "law_name": "نظام الأحوال الشخصية",
-            "royal_decree": "م/73",
-            "decree_date": "1443/6/8هـ",
-            "structure": {k: v["title"] for k, v in LAW_STRUCTURE.items()},
-            "articles": all_articles,
-        }, f, ensure_ascii=False, indent=2)
+    header = {
+        "total_chunks": len(all_articles),
+        "law_name": "نظام الأحوال الشخصية",
+        "royal_decree": "م/73",
+        "decree_date": "1443/6/8هـ",
+        "structure": {k: v["title"] for k, v in LAW_STRUCTURE.items()},
+    }
+    write_articles_json(output_path, header, all_articles)
 
     print(f"\n✓ تم حفظ {len(all_articles)} مقطع في: {output_path}")
 
+    # 4. SQLite index for the articles browser endpoints
+    sys.path.insert(0, project_dir)
+    from backend.rag.articles_db import build_articles_db
+    db_path = os.path.join(script_dir, "articles.db")
+    build_articles_db({**header, "articles": all_articles}, db_path)
+    print(f"✓ تم بناء فهرس المواد: {db_path}")
+
     # Print summary
     topics = {}
     for a in all_articles:
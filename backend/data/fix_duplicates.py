@@ -2,16 +2,45 @@
 Fix duplicate text in articles extracted from PDF.
 The PDF has two text layers causing every phrase to appear twice consecutively.
 """
-import json
 import re
 import os
+import numpy as np
+import orjson
+
+try:
+    from numba import njit
+except ImportError:  # optional speed-up for remove_short_dups (see _dedup_scan)
+    njit = None
 
 ARTICLES_PATH = os.path.join(os.path.dirname(__file__), "articles.json")
 
+# Whitespace, tatweel and diacritics — ignored when comparing text.
+# Every Unicode whitespace char lies below U+3001, matching regex \s.
+_STRIP_TABLE = str.maketrans(dict.fromkeys(
+    [c for c in range(0x3001) if chr(c).isspace()]
+    + [0x0640] + list(range(0x064B, 0x0660)) + [0x0670]
+))
+# Doubled page numbers like ٣١٣١
+_PAGENUM_RE = re.compile(r'([٠-٩]{2,4})\1')
+# Punctuation that starts a repeated ":الشرح: الشرح" span (see drop_punct_dups)
+_PUNCT = frozenset(':.،؛')
+
 
 def normalize(text):
     """Remove spaces, diacritics, tatweel for comparison."""
-    return re.sub(r'[\s\u0640\u064B-\u065F\u0670]', '', text)
+    return text.translate(_STRIP_TABLE)
+
+
+def _word_offsets(words):
+    """Normalized concatenation of words + offset of each word boundary in it.
+
+    normalize(' '.join(words[a:b])) == joined[pos[a]:pos[b]], since the
+    joining spaces are stripped by normalize anyway.
+    """
+    norm = [normalize(w) for w in words]
+    pos = np.zeros(len(words) + 1, dtype=np.int64)
+    np.cumsum([len(w) for w in norm], out=pos[1:])
+    return ''.join(norm), pos
 
 
 def deduplicate_pdf_text(text):
@@ -25,7 +54,7 @@ def deduplicate_pdf_text(text):
             continue
 
         # Remove duplicate page numbers like ٣١٣١ -> ٣١
-        line = re.sub(r'([٠-٩]{2,4})\1', r'\1', line)
+        line = _PAGENUM_RE.sub(r'\1', line)
 
         words = line.split()
         n = len(words)
@@ -34,14 +63,17 @@ def deduplicate_pdf_text(text):
             cleaned.append(line)
             continue
 
-        # Try to split the line into two halves where second = duplicate of first
+        # Try to split the line into two halves where second = duplicate of first.
+        # The normalized halves can only be equal if the split sits exactly at
+        # the middle of the normalized line, so look that word boundary up directly.
         best = None
-        for mid in range(max(1, n // 3), min(n, 2 * n // 3 + 1)):
-            part1 = ' '.join(words[:mid])
-            part2 = ' '.join(words[mid:])
-            if normalize(part1) == normalize(part2) and len(normalize(part1)) > 2:
-                best = part1
-                break
+        joined, pos = _word_offsets(words)
+        half, odd = divmod(len(joined), 2)
+        if not odd and half > 2:
+            lo, hi = max(1, n // 3), min(n, 2 * n // 3 + 1)
+            mid = lo + int(np.searchsorted(pos[lo:hi], half))
+            if mid < hi and pos[mid] == half and joined[:half] == joined[half:]:
+                best = ' '.join(words[:mid])
 
         if best is None:
             # Try word-level duplicate removal
@@ -61,32 +93,117 @@ def deduplicate_pdf_text(text):
     result = '\n'.join(final)
 
     # Remove patterns like ":الشرح: الشرح" -> ":الشرح"
-    # Pattern: punctuation + words + same punctuation + same words
-    result = re.sub(
-        r'([:\.،؛]\s*)([^\n:\.،؛]{2,40}?)\1\2',
-        r'\1\2',
-        result
-    )
+    return drop_punct_dups(result)
+
+
+def drop_punct_dups(text):
+    """Collapse punctuation + words repeated right after themselves.
+
+    Same result as re.sub(r'([:\.،؛]\s*)([^\n:\.،؛]{2,40}?)\1\2', r'\1\2', text),
+    but the two copies are compared with startswith instead of regex
+    backreferences, so the work per punctuation mark is bounded.
+    """
+    n = len(text)
+    out = []
+    last = i = 0
+    while i < n:
+        if text[i] not in _PUNCT:
+            i += 1
+            continue
+        ws = i + 1
+        while ws < n and text[ws].isspace():
+            ws += 1
+        end = None
+        # Same search order as the regex: longest separator first, then
+        # the shortest repeated body.
+        for start in range(ws, i, -1):
+            sep = text[i:start]
+            run = start
+            limit = min(n, start + 40)
+            while run < limit and text[run] != '\n' and text[run] not in _PUNCT:
+                run += 1
+            for body_end in range(start + 2, run + 1):
+                body = text[start:body_end]
+                if text.startswith(sep, body_end) and text.startswith(body, body_end + len(sep)):
+                    end = body_end + len(sep) + len(body)
+                    break
+            if end is not None:
+                break
+        if end is None:
+            i += 1
+            continue
+        out.append(text[last:body_end])
+        last = i = end
+    out.append(text[last:])
+    return ''.join(out)
 
-    return result
+
+def _dedup_scan(codes, pos):
+    """Keep-mask over words: False for the second copy of each repeated run.
+
+    codes are the code points of the normalized line and pos the word
+    boundary offsets into it (see _word_offsets). Pure integer loops so the
+    same function compiles under numba's nopython mode.
+    """
+    n = pos.shape[0] - 1
+    keep = np.ones(n, dtype=np.bool_)
+    i = 0
+    while i < n:
+        step = 1
+        for slen in range(min(20, (n - i) // 2), 0, -1):
+            a, mid, b = pos[i], pos[i + slen], pos[i + slen * 2]
+            size = mid - a
+            if size != b - mid or size <= 2:
+                continue
+            same = True
+            for k in range(size):
+                if codes[a + k] != codes[mid + k]:
+                    same = False
+                    break
+            if same:
+                keep[i + slen:i + slen * 2] = False
+                step = slen * 2
+                break
+        i += step
+    return keep
+
+
+if njit is not None:
+    _dedup_kernel = njit("boolean[:](int32[:], int64[:])", cache=True)(_dedup_scan)
+else:
+    _dedup_kernel = None
 
 
 def remove_short_dups(line):
     """Remove consecutive duplicate word sequences within a line."""
     words = line.split()
+    n = len(words)
+    joined, pos = _word_offsets(words)
+
+    if _dedup_kernel is not None:
+        codes = np.frombuffer(joined.encode('utf-32-le'), dtype=np.int32)
+        keep = _dedup_kernel(codes, pos)
+        return ' '.join(w for w, k in zip(words, keep) if k)
+
+    # cand[slen][i]: the slen-word windows at i and i+slen normalize to the
+    # same length (> 2). Computed for every i at once; only these positions
+    # need an actual string comparison in the scan below.
+    cand = [None]
+    for slen in range(1, min(20, n // 2) + 1):
+        first = pos[slen:n - slen + 1] - pos[:n - 2 * slen + 1]
+        second = pos[2 * slen:] - pos[slen:n - slen + 1]
+        cand.append(((first == second) & (first > 2)).tolist())
+
     result = []
     i = 0
-    while i < len(words):
+    while i < n:
         found = False
-        for slen in range(min(20, (len(words) - i) // 2), 0, -1):
-            if i + slen * 2 > len(words):
+        for slen in range(min(20, (n - i) // 2), 0, -1):
+            if not cand[slen][i]:
                 continue
-            s1 = words[i:i + slen]
-            s2 = words[i + slen:i + slen * 2]
-            n1 = normalize(' '.join(s1))
-            n2 = normalize(' '.join(s2))
-            if n1 == n2 and len(n1) > 2:
-                result.extend(s1)
+            a, mid, b = pos[i], pos[i + slen], pos[i + slen * 2]
+            if joined[a:mid] == joined[mid:b]:
+                result.extend(words[i:i + slen])
                 i += slen * 2
                 found = True
                 break
@@ -98,8 +215,8 @@ def remove_short_dups(line):
 
 def fix_all_articles():
     """Fix duplicate text in all articles and rebuild ChromaDB."""
-    with open(ARTICLES_PATH, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    with open(ARTICLES_PATH, 'rb') as f:
+        data = orjson.loads(f.read())
 
     total = 0
     fixed = 0
@@ -119,8 +236,8 @@ def fix_all_articles():
             fixed += 1
 
     # Save
-    with open(ARTICLES_PATH, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    with open(ARTICLES_PATH, 'wb') as f:
+        f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
 
     reduction = (1 - total_fixed_chars / total_orig_chars) * 100
     print(f"Fixed {fixed}/{total} articles")
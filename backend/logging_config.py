@@ -1,8 +1,12 @@
 """Structured logging configuration with request ID tracking for Sanad AI backend."""
 
+import atexit
 import logging
+import os
+import queue
 import sys
 import uuid
+from logging.handlers import QueueHandler, QueueListener
 from contextvars import ContextVar
 
 # Context variable for request ID tracking
@@ -16,22 +20,41 @@ class RequestIDFilter(logging.Filter):
         return True
 
 
+_listener: QueueListener | None = None
+_queue_handler: QueueHandler | None = None
+_stream_handler: logging.Handler | None = None
+
+
 def setup_logging():
-    """Configure structured logging with request ID tracking."""
+    """Configure structured logging with request ID tracking.
+
+    Callers only enqueue records; a background listener thread writes them
+    to stdout, so a burst of errors never blocks the event loop on I/O.
+    Threads don't survive fork (gunicorn --preload imports this in the
+    master), so each forked worker starts its own listener.
+    """
+    global _queue_handler, _stream_handler
     fmt = "%(asctime)s [%(levelname)s] %(name)s [%(request_id)s]: %(message)s"
     datefmt = "%Y-%m-%d %H:%M:%S"
 
-    logging.basicConfig(
-        level=logging.INFO,
-        format=fmt,
-        datefmt=datefmt,
-        stream=sys.stdout,
-        force=True,
-    )
+    _stream_handler = logging.StreamHandler(sys.stdout)
+    _stream_handler.setFormatter(logging.Formatter(fmt, datefmt=datefmt))
+
+    _queue_handler = QueueHandler(queue.SimpleQueue())
+    # Handler filters run in the caller's context, where request_id_var is
+    # set (a filter on the root logger would skip propagated records)
+    _queue_handler.addFilter(RequestIDFilter())
 
-    # Add request ID filter to root logger
+    if _listener is not None:
+        _listener.stop()
     root = logging.getLogger()
-    root.addFilter(RequestIDFilter())
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+    root.addHandler(_queue_handler)
+    root.setLevel(logging.INFO)
+
+    _start_listener()
 
     # Quiet noisy libraries
     logging.getLogger("httpx").setLevel(logging.WARNING)
@@ -40,6 +63,29 @@ def setup_logging():
     logging.getLogger("sentence_transformers").setLevel(logging.WARNING)
 
 
+def _start_listener():
+    """Start a listener on a fresh queue (the parent's may hold a lock mid-put)."""
+    global _listener
+    _queue_handler.queue = queue.SimpleQueue()
+    _listener = QueueListener(_queue_handler.queue, _stream_handler)
+    _listener.start()
+
+
+def _restart_listener_after_fork():
+    if _queue_handler is not None:
+        _start_listener()
+
+
+os.register_at_fork(after_in_child=_restart_listener_after_fork)
+
+
+@atexit.register
+def _flush_logs():
+    """Drain queued records before the process exits."""
+    if _listener is not None:
+        _listener.stop()
+
+
 def get_logger(name: str) -> logging.Logger:
     """Get a named logger."""
     return logging.getLogger(name)
@@ -2,15 +2,24 @@
 Sanad AI — FastAPI Backend (أحوال شخصية + معاملات مدنية + إثبات + مرافعات)
 """
 from __future__ import annotations
+import asyncio
+import contextvars
+import functools
+import hashlib
 import json
 import os
+import re
+import time
 import uuid as _uuid
 from contextlib import asynccontextmanager
 from typing import Dict, List, Optional
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+import numpy as np
+import orjson
 from pydantic import BaseModel
+from backend.config import ARTICLES_JSON_PATH
 from backend.logging_config import setup_logging, get_logger
 
 setup_logging()
@@ -28,16 +37,69 @@ if _sentry_dsn:
     )
     log.info("Sentry initialized for error tracking")
 
+# Route dependencies — imported once at startup, not on each request
+from backend.db import get_supabase
+from backend.rag.article_lookup import initialize_article_lookup, lookup_article
+from backend.rag.batcher import search_batcher
+from backend.rag.articles_db import (
+    ensure_articles_db, get_articles_json, get_data_etag, get_meta, get_topics_json,
+)
+from backend.rag.classifier import classify_query
+from backend.rag.embeddings import embed_queries_async, embed_query_list, shutdown_embed_workers
+from backend.rag.pipeline import retrieve_context
+from backend.rag.qa_cache import (
+    initialize_qa_cache, match_qa_cache, get_cached_response, cache_response,
+)
+from backend.rag.vector_store import get_collection, get_collection_count, search, search_batch
+from backend.services.admin import (
+    check_admin, get_admin_stats, get_admin_users, update_user_subscription_admin,
+    get_user_role,
+)
+from backend.services.contract_analyzer import (
+    extract_text_from_pdf, extract_text_from_docx, detect_contract_type,
+    stream_contract_analysis, CONTRACT_RAG_QUERIES,
+)
+from backend.services.deadline_calculator import calculate_deadline as compute_deadline
+from backend.services.document_drafter import (
+    validate_draft_request, build_drafting_prompt, get_draft_types,
+)
+from backend.services.legal_assistant import (
+    close_clients, generate_legal_response, stream_legal_response, generate_draft,
+)
+from backend.services.payment import (
+    create_payment_form_data, verify_payment, cancel_subscription, handle_webhook,
+)
+from backend.services.paypal import create_order, capture_order
+from backend.services.subscription import (
+    check_limit, check_model_mode, increment_usage, get_user_subscription, increment_trial,
+    FREE_FEATURES, get_all_plans, get_user_usage_summary,
+)
+from backend.services.verdict_predictor import (
+    detect_case_type, stream_verdict_prediction, CASE_RAG_QUERIES,
+)
+from backend.services.write_batcher import analytics_batcher, feedback_batcher
+from backend.stream_buffer import coalesce_tokens, create_stream, get_stream
+
 # Track whether vector DB is ready (for health check)
 _db_ready = False
 
+# Concurrent Claude streams per worker; /api/ask-stream answers 503 beyond this
+MAX_CONCURRENT_STREAMS = int(os.getenv("MAX_CONCURRENT_STREAMS", "32"))
+_stream_slots = asyncio.Semaphore(MAX_CONCURRENT_STREAMS)
+
+
+def _warm_up_search():
+    """Load the embedding model and page the HNSW index in before the first request."""
+    start = time.perf_counter()
+    search(embed_query_list("تهيئة"), n_results=1)
+    log.info("Search warmed up in %.0f ms", (time.perf_counter() - start) * 1000)
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Initialize ChromaDB at startup — DB is pre-built during Docker build."""
     global _db_ready
     log.info("Initializing ChromaDB...")
-    from backend.rag.vector_store import get_collection, get_collection_count
     col = get_collection()
     count = col.count()
 
@@ -56,15 +118,29 @@ async def lifespan(app: FastAPI):
         except Exception as e:
             log.error("Failed to build database: %s", e)
 
+    # articles.db ships with the image; rebuild it only if it is missing or stale
+    try:
+        await asyncio.to_thread(ensure_articles_db)
+    except Exception as e:
+        log.error("Failed to build articles.db: %s", e)
+
+    if _db_ready:
+        try:
+            await asyncio.to_thread(_warm_up_search)
+        except Exception as e:
+            log.warning("Search warmup failed: %s", e)
+
     # Initialize QA cache and article lookup (zero-cost tiers)
-    from backend.rag.qa_cache import initialize_qa_cache
-    from backend.rag.article_lookup import initialize_article_lookup
     log.info("Initializing QA cache...")
     initialize_qa_cache()
     initialize_article_lookup()
 
     log.info("Server ready to accept requests")
     yield
+    await feedback_batcher.drain()
+    await analytics_batcher.drain()
+    await close_clients()
+    shutdown_embed_workers()
 
 
 app = FastAPI(
@@ -72,14 +148,24 @@ app = FastAPI(
     description="مستشار قانوني ذكي متخصص في أنظمة الأحوال الشخصية والمعاملات المدنية والإثبات والمرافعات الشرعية والمحاكم التجارية السعودية",
     version="2.0.0",
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
-ALLOWED_ORIGINS = os.getenv("ALLOWED_ORIGINS", "http://localhost:3000,http://127.0.0.1:3000,http://localhost:3001,http://127.0.0.1:3001").split(",")
+# Entries are stripped so "a.com, b.com" style values still match the Origin header
+ALLOWED_ORIGINS = [
+    origin.strip()
+    for origin in os.getenv("ALLOWED_ORIGINS", "http://localhost:3000,http://127.0.0.1:3000,http://localhost:3001,http://127.0.0.1:3001").split(",")
+    if origin.strip()
+]
 
 # Security middleware
 # Order matters: last added = outermost (processes request first)
 # CORS must be outermost so it adds headers even on 401/403 responses from JWT middleware
-from backend.middleware import JWTAuthMiddleware, RequestIDMiddleware, SecurityHeadersMiddleware
+from backend.middleware import (
+    JWTAuthMiddleware, RequestIDMiddleware, SecurityHeadersMiddleware, StreamAwareGZipMiddleware,
+)
+# Innermost: compresses handler output, skips the SSE endpoints
+app.add_middleware(StreamAwareGZipMiddleware, minimum_size=1024)
 app.add_middleware(JWTAuthMiddleware)
 app.add_middleware(RequestIDMiddleware)
 app.add_middleware(SecurityHeadersMiddleware)
@@ -90,6 +176,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "OPTIONS"],
     allow_headers=["Authorization", "Content-Type", "X-API-Key", "X-Request-ID"],
+    expose_headers=["X-Stream-ID", "X-Cache"],
 )
 
 
@@ -114,6 +201,11 @@ class SearchRequest(BaseModel):
     topic: Optional[str] = None
     top_k: int = 10
 
+class SearchBatchRequest(BaseModel):
+    queries: List[str]
+    topic: Optional[str] = None
+    top_k: int = 10
+
 class FeedbackRequest(BaseModel):
     message_id: str
     conversation_id: str
@@ -130,21 +222,191 @@ class SubscriptionCreateRequest(BaseModel):
     billing_cycle: str = "monthly"
 
 
-# --- Helper: get user_id from request ---
+# --- Helper: question access checks ---
+
+async def _check_question_limits(user_id: Optional[str], model_mode: str) -> bool:
+    """Plan checks for /api/ask and /api/ask-stream — raises 429/403 when denied.
+
+    Read-only: charges nothing, so it can run alongside the cache tiers and
+    retrieval. Returns True when a free user asks in mode 2.1 and must spend
+    a trial (see _charge_question).
+    """
+    if not user_id:
+        return False
+
+    allowed, msg = await check_limit(user_id, "questions")
+    if not allowed:
+        raise HTTPException(status_code=429, detail=msg)
+    mode_ok, mode_msg = await check_model_mode(user_id, model_mode)
+    if not mode_ok:
+        raise HTTPException(status_code=403, detail=mode_msg)
+
+    if model_mode == "2.1":
+        sub = await get_user_subscription(user_id)
+        features = sub.get("features", FREE_FEATURES)
+        return "2.1" not in features.get("model_modes", [])
+    return False
+
+
+async def _charge_question(user_id: Optional[str], needs_trial: bool, count_usage: bool) -> None:
+    """Consume the mode-2.1 trial (atomically; 403 when none left) and count usage."""
+    if not user_id:
+        return
+    if needs_trial:
+        trial_result = await increment_trial(user_id, "model_mode_2.1")
+        if not trial_result["allowed"]:
+            raise HTTPException(status_code=403, detail=(
+                "استنفدت التجارب المجانية الثلاث للوضع المفصّل (سند 2.1). "
+                "ترقَّ للباقة الأساسية أو أعلى لاستخدام غير محدود."
+            ))
+    if count_usage:
+        await increment_usage(user_id, "questions")
+
+
+def _drop_access_checks(access: asyncio.Task) -> None:
+    """Settle the access-check task once its endpoint is done with it.
+
+    An endpoint that fails before awaiting the checks (cache lookup or
+    retrieval raising) cancels them; a failure it never awaited is marked
+    retrieved so asyncio doesn't log it as lost.
+    """
+    if not access.done():
+        access.cancel()
+    elif not access.cancelled():
+        access.exception()
+
+
+async def _retrieve_after_access(access: asyncio.Task, *args, **kwargs) -> dict:
+    """Run retrieve_context in a thread while the access checks finish.
+
+    The checks still decide: if they raise, the retrieval result is dropped.
+    The thread is submitted right away (asyncio.to_thread would only start
+    it once the event loop next gets to it, after the checks ran).
+    """
+    ctx = contextvars.copy_context()
+    retrieval = asyncio.get_running_loop().run_in_executor(
+        None, functools.partial(ctx.run, retrieve_context, *args, **kwargs),
+    )
+    try:
+        await access
+    except BaseException:
+        retrieval.cancel()
+        raise
+    return await retrieval
+
+
+# --- Helper: SSE frames ---
+
+def _sse(event: dict) -> bytes:
+    """Encode one server-sent event frame (orjson emits UTF-8 bytes directly)."""
+    return b"data: " + orjson.dumps(event) + b"\n\n"
+
+
+_SSE_DONE = _sse({"type": "done"})
+_SSE_TOKEN_HEAD = b'data: {"type":"token","text":'
+
 
-def _get_user_id(request) -> Optional[str]:
-    """Extract user_id from request state (set by JWTAuthMiddleware)."""
-    return getattr(request.state, "user_id", None)
+def _sse_token(text: str) -> bytes:
+    """Token frame, same bytes as _sse({"type": "token", "text": text}) without the dict."""
+    return _SSE_TOKEN_HEAD + orjson.dumps(text) + b"}\n\n"
+
+
+def _sse_error(message: str) -> bytes:
+    return _sse({"type": "error", "message": message})
+
+
+# User-facing Arabic error frames, encoded once. Each table maps a marker
+# in the lowercased upstream error text to its frame; first match wins.
+def _error_table(*entries: tuple[str, bytes]) -> tuple[re.Pattern, dict[str, bytes]]:
+    """Compile (marker, frame) pairs for _error_frame — earlier markers win.
+
+    Markers match case-insensitively anywhere in the message; numeric
+    status codes only as whole words, so ids like "req_4291" don't count.
+    """
+    frames = dict(entries)
+    pattern = re.compile(
+        "|".join(rf"\b{m}\b" if m.isdigit() else re.escape(m) for m in frames),
+        re.IGNORECASE,
+    )
+    return pattern, frames
+
+
+_ERR_RATE_LIMIT = _sse_error("الخادم مشغول حالياً — يرجى الانتظار بضع ثوانٍ ثم إعادة المحاولة")
+_ERR_OVERLOADED = _sse_error("الخادم مشغول — يرجى المحاولة مرة أخرى بعد لحظات")
+_ERR_AUTH = _sse_error("خطأ في إعدادات النظام — يرجى التواصل مع الإدارة")
+_ERR_ASK_GENERIC = _sse_error("حدث خطأ أثناء معالجة طلبك — يرجى المحاولة مرة أخرى")
+_ASK_STREAM_ERRORS = _error_table(
+    ("rate_limit", _ERR_RATE_LIMIT), ("429", _ERR_RATE_LIMIT),
+    ("overloaded", _ERR_OVERLOADED), ("529", _ERR_OVERLOADED),
+    ("api_key", _ERR_AUTH), ("auth", _ERR_AUTH),
+)
+
+_ERR_BUSY = _sse_error("الخادم مشغول حالياً — يرجى المحاولة بعد لحظات")
+_BUSY_ERRORS = _error_table(("rate_limit", _ERR_BUSY), ("429", _ERR_BUSY))
+# Errors expected under load — logged without a traceback
+_TRANSIENT_ERRORS = re.compile(r"rate_limit|\b429\b|overloaded|\b529\b", re.IGNORECASE)
+_ERR_CONTRACT_GENERIC = _sse_error("حدث خطأ أثناء تحليل العقد — يرجى المحاولة مرة أخرى")
+_ERR_VERDICT_GENERIC = _sse_error("حدث خطأ أثناء توقع الحكم — يرجى المحاولة مرة أخرى")
+
+
+def _error_frame(e: Exception, table: tuple[re.Pattern, dict[str, bytes]], fallback: bytes) -> bytes:
+    """Pick the error frame for e from table (see _ASK_STREAM_ERRORS)."""
+    pattern, frames = table
+    found = {marker.lower() for marker in pattern.findall(str(e))}
+    if not found:
+        return fallback
+    return next(frame for marker, frame in frames.items() if marker in found)
+
+
+def _log_stream_error(what: str, e: Exception) -> None:
+    """Rate-limit/overload errors are expected under load — log them without a traceback."""
+    if _TRANSIENT_ERRORS.search(str(e)):
+        log.warning("%s: %s", what, e)
+    else:
+        log.exception(what)
+
+
+# --- Helper: conditional GET ---
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    """True if the request's If-None-Match already names this ETag."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [t.strip().removeprefix("W/") for t in header.split(",")]
+    return "*" in tags or etag in tags
+
+
+def _json_with_etag(request: Request, body: bytes, etag: str, cache_control: str) -> Response:
+    """JSON body tagged with etag, or an empty 304 if the client has it already."""
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def _static_etag(body: bytes) -> str:
+    return f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+# Responses that only change on deploy may be reused for an hour; the
+# articles endpoints follow articles.json, so clients revalidate each time
+# (a 304 costs one stat call). Both are private — every /api route is
+# authenticated, so shared caches must not keep them.
+_CACHE_STATIC = "private, max-age=3600"
+_CACHE_REVALIDATE = "private, no-cache"
 
 
 # --- Endpoints ---
 
 @app.get("/api/health")
 async def health_check():
-    """Health check endpoint."""
-    from backend.rag.vector_store import get_collection_count
-    count = get_collection_count()
-    status = "healthy" if _db_ready and count > 0 else "degraded"
+    """Health check endpoint.
+
+    _db_ready is only set once the lifespan has seen a non-empty collection,
+    and the collection is read-only afterwards, so polls don't query ChromaDB.
+    """
+    status = "healthy" if _db_ready else "degraded"
     return {
         "status": status,
         "service": "Sanad AI",
@@ -152,10 +414,8 @@ async def health_check():
 
 
 @app.post("/api/ask")
-async def ask_question(req: QuestionRequest, request: Request):
+async def ask_question(req: QuestionRequest, request: Request, response: Response):
     """Legal consultation endpoint."""
-    from backend.rag.pipeline import retrieve_context
-    from backend.services.legal_assistant import generate_legal_response
 
     if not req.question.strip():
         raise HTTPException(status_code=400, detail="السؤال مطلوب")
@@ -166,44 +426,30 @@ async def ask_question(req: QuestionRequest, request: Request):
             detail="جاري تجهيز قاعدة البيانات... يرجى المحاولة بعد دقيقة"
         )
 
-    # Check subscription limits
-    user_id = _get_user_id(request)
-    if user_id:
-        from backend.services.subscription import (
-            check_limit, check_model_mode, increment_usage,
-            get_user_subscription, increment_trial, FREE_FEATURES,
-        )
-        allowed, msg = await check_limit(user_id, "questions")
-        if not allowed:
-            raise HTTPException(status_code=429, detail=msg)
-        mode_ok, mode_msg = await check_model_mode(user_id, req.model_mode or "1.1")
-        if not mode_ok:
-            raise HTTPException(status_code=403, detail=mode_msg)
-
-        # If free user is using mode 2.1, atomically consume a trial
-        effective_model = req.model_mode or "1.1"
-        if effective_model == "2.1":
-            sub = await get_user_subscription(user_id)
-            features = sub.get("features", FREE_FEATURES)
-            if "2.1" not in features.get("model_modes", []):
-                trial_result = await increment_trial(user_id, "model_mode_2.1")
-                if not trial_result["allowed"]:
-                    raise HTTPException(status_code=403, detail=(
-                        "استنفدت التجارب المجانية الثلاث للوضع المفصّل (سند 2.1). "
-                        "ترقَّ للباقة الأساسية أو أعلى لاستخدام غير محدود."
-                    ))
+    # Subscription checks (Supabase) overlap with the cache tiers and
+    # retrieval; every path awaits them before answering. They charge
+    # nothing: each path calls _charge_question once it has its answer
+    user_id = request.state.user_id
+    access = asyncio.create_task(_check_question_limits(user_id, req.model_mode or "1.1"))
+    try:
+        return await _answer_question(req, response, user_id, access)
+    finally:
+        _drop_access_checks(access)
+
+
+async def _answer_question(
+    req: QuestionRequest, response: Response, user_id: Optional[str], access: asyncio.Task,
+) -> dict:
+    """Cache tiers, then RAG + Claude, for /api/ask."""
 
     # === Tier 1 & 2: Zero-cost layers (skip for follow-up questions) ===
     if not req.chat_history:
-        from backend.rag.qa_cache import match_qa_cache
-        from backend.rag.article_lookup import lookup_article
 
         # Tier 1: QA cache match
-        qa_match = match_qa_cache(req.question)
+        qa_match = await asyncio.to_thread(match_qa_cache, req.question)
         if qa_match:
+            await _charge_question(user_id, await access, count_usage=True)
             log.info("QA cache hit (similarity=%.3f, id=%s)", qa_match["similarity"], qa_match["qa_id"])
-            if user_id:
-                await increment_usage(user_id, "questions")
             return {
                 "answer": qa_match["corrected_answer"],
                 "classification": {
@@ -221,9 +467,8 @@ async def ask_question(req: QuestionRequest, request: Request):
         # Tier 2: Direct article lookup
         article_match = lookup_article(req.question)
         if article_match:
+            await _charge_question(user_id, await access, count_usage=True)
             log.info("Article lookup hit (article %s — %s)", article_match["article_number"], article_match["law"])
-            if user_id:
-                await increment_usage(user_id, "questions")
             return {
                 "answer": article_match["response"],
                 "classification": {
@@ -238,24 +483,21 @@ async def ask_question(req: QuestionRequest, request: Request):
                 "has_deadlines": False,
             }
 
-    # === Tier 2.5: Response cache (cached Claude responses) ===
-    if not req.chat_history:
-        from backend.rag.qa_cache import get_cached_response
-        cached = get_cached_response(req.question, req.model_mode or "1.1")
-        if cached:
-            log.info("Response cache hit")
-            if user_id:
-                await increment_usage(user_id, "questions")
-            return {
-                "answer": cached["answer"],
-                "classification": cached["classification"],
-                "sources": cached["sources"],
-                "has_deadlines": cached["classification"].get("needs_deadline_check", False),
-            }
+    # === Tier 2.5: Response cache (cached Claude responses, follow-ups included) ===
+    cached = get_cached_response(req.question, req.model_mode or "1.1", req.chat_history)
+    if cached:
+        await _charge_question(user_id, await access, count_usage=True)
+        log.info("Response cache hit")
+        response.headers["X-Cache"] = "HIT"
+        return {
+            "answer": cached["answer"],
+            "classification": cached["classification"],
+            "sources": cached["sources"],
+            "has_deadlines": cached["classification"].get("needs_deadline_check", False),
+        }
 
     # === Tier 3: Claude API (full RAG + LLM) ===
     # Pre-classify for smart routing and context optimization
-    from backend.rag.classifier import classify_query
     pre_class = classify_query(req.question)
 
     # Smart model routing: simple factual → mode 1.1 (saves ~62% tokens)
@@ -269,10 +511,13 @@ async def ask_question(req: QuestionRequest, request: Request):
 
     # Reduce RAG context for simple questions
     top_k = 3 if pre_class["intent"] == "معلومة" else 5
-    rag_result = retrieve_context(req.question, top_k=top_k, chat_history=req.chat_history)
+    rag_result = await _retrieve_after_access(
+        access, req.question, top_k=top_k, chat_history=req.chat_history,
+    )
 
     try:
-        answer = generate_legal_response(
+        answer = await asyncio.to_thread(
+            generate_legal_response,
             question=req.question,
             context=rag_result["context"],
             classification=rag_result["classification"],
@@ -286,18 +531,16 @@ async def ask_question(req: QuestionRequest, request: Request):
         log.exception("Claude API error")
         raise HTTPException(status_code=500, detail="حدث خطأ أثناء معالجة طلبك — يرجى المحاولة مرة أخرى")
 
-    # Cache response for future reuse (only first questions, not follow-ups)
-    if not req.chat_history:
-        from backend.rag.qa_cache import cache_response
-        cache_response(
-            req.question, effective_mode, answer,
-            rag_result["classification"], rag_result["sources"],
-        )
-        log.info("Response cached: %s...", req.question[:50])
+    # Cache response for future reuse (keyed by question, mode and history)
+    cache_response(
+        req.question, effective_mode, answer,
+        rag_result["classification"], rag_result["sources"], req.chat_history,
+    )
+    log.info("Response cached: %s...", req.question[:50])
+    response.headers["X-Cache"] = "MISS"
 
-    # Increment usage after success
-    if user_id:
-        await increment_usage(user_id, "questions")
+    # Spend the trial and count usage after success
+    await _charge_question(user_id, access.result(), count_usage=True)
 
     return {
         "answer": answer,
@@ -310,8 +553,6 @@ async def ask_question(req: QuestionRequest, request: Request):
 @app.post("/api/ask-stream")
 async def ask_question_stream(req: QuestionRequest, request: Request):
     """Legal consultation endpoint with SSE streaming."""
-    from backend.rag.pipeline import retrieve_context
-    from backend.services.legal_assistant import stream_legal_response
 
     if not req.question.strip():
         raise HTTPException(status_code=400, detail="السؤال مطلوب")
@@ -322,74 +563,58 @@ async def ask_question_stream(req: QuestionRequest, request: Request):
             detail="جاري تجهيز قاعدة البيانات... يرجى المحاولة بعد دقيقة"
         )
 
-    # Check subscription limits before streaming
-    user_id = _get_user_id(request)
-    if user_id:
-        from backend.services.subscription import (
-            check_limit, check_model_mode, increment_usage,
-            get_user_subscription, increment_trial, FREE_FEATURES,
-        )
-        allowed, msg = await check_limit(user_id, "questions")
-        if not allowed:
-            raise HTTPException(status_code=429, detail=msg)
-        mode_ok, mode_msg = await check_model_mode(user_id, req.model_mode or "1.1")
-        if not mode_ok:
-            raise HTTPException(status_code=403, detail=mode_msg)
-
-        # If free user is using mode 2.1, atomically consume a trial
-        effective_model = req.model_mode or "1.1"
-        if effective_model == "2.1":
-            sub = await get_user_subscription(user_id)
-            features = sub.get("features", FREE_FEATURES)
-            if "2.1" not in features.get("model_modes", []):
-                trial_result = await increment_trial(user_id, "model_mode_2.1")
-                if not trial_result["allowed"]:
-                    raise HTTPException(status_code=403, detail=(
-                        "استنفدت التجارب المجانية الثلاث للوضع المفصّل (سند 2.1). "
-                        "ترقَّ للباقة الأساسية أو أعلى لاستخدام غير محدود."
-                    ))
-
-        # Increment usage before streaming (can't do it after for StreamingResponse)
-        await increment_usage(user_id, "questions")
+    # Subscription checks (Supabase) overlap with the cache tiers and
+    # retrieval; every path awaits them before streaming. They charge
+    # nothing: each path that answers calls _charge_question once it will,
+    # counting usage up front (can't do it after for StreamingResponse)
+    user_id = request.state.user_id
+    access = asyncio.create_task(_check_question_limits(user_id, req.model_mode or "1.1"))
+    try:
+        return await _answer_question_stream(req, user_id, access)
+    finally:
+        _drop_access_checks(access)
+
+
+async def _answer_question_stream(
+    req: QuestionRequest, user_id: Optional[str], access: asyncio.Task,
+) -> StreamingResponse:
+    """Cache tiers, then RAG + a buffered Claude stream, for /api/ask-stream."""
 
     # === Tier 1 & 2: Zero-cost layers (skip for follow-up questions) ===
     if not req.chat_history:
-        from backend.rag.qa_cache import match_qa_cache
-        from backend.rag.article_lookup import lookup_article
 
         # Tier 1: QA cache match
-        qa_match = match_qa_cache(req.question)
+        qa_match = await asyncio.to_thread(match_qa_cache, req.question)
         if qa_match:
+            await _charge_question(user_id, await access, count_usage=True)
             log.info("QA cache hit [stream] (similarity=%.3f, id=%s)", qa_match["similarity"], qa_match["qa_id"])
 
-            def cached_event_stream():
-                import time
-                classification = {
+            meta_frame = _sse({
+                "type": "meta",
+                "classification": {
                     "category": qa_match["category"],
                     "intent": "استشارة",
                     "urgency": "عادي",
                     "needs_deadline_check": False,
                     "all_categories": [qa_match["category"]],
                     "source": "qa_cache",
-                }
-                meta = json.dumps({
-                    "type": "meta",
-                    "classification": classification,
-                    "sources": qa_match["sources"],
-                    "has_deadlines": False,
-                }, ensure_ascii=False)
-                yield f"data: {meta}\n\n"
+                },
+                "sources": qa_match["sources"],
+                "has_deadlines": False,
+            })
+
+            async def cached_event_stream():
+                yield meta_frame
 
                 # Split answer into paragraphs for natural streaming feel
                 answer = qa_match["corrected_answer"]
                 paragraphs = answer.split("\n\n")
                 for i, para in enumerate(paragraphs):
                     text = para if i == 0 else f"\n\n{para}"
-                    chunk = json.dumps({"type": "token", "text": text}, ensure_ascii=False)
-                    yield f"data: {chunk}\n\n"
-                    time.sleep(0.02)
+                    yield _sse_token(text)
+                    await asyncio.sleep(0.02)
 
-                yield f"data: {json.dumps({'type': 'done'})}\n\n"
+                yield _SSE_DONE
 
             return StreamingResponse(
                 cached_event_stream(),
@@ -400,35 +625,34 @@ async def ask_question_stream(req: QuestionRequest, request: Request):
         # Tier 2: Direct article lookup
         article_match = lookup_article(req.question)
         if article_match:
+            await _charge_question(user_id, await access, count_usage=True)
             log.info("Article lookup hit [stream] (article %s — %s)", article_match["article_number"], article_match["law"])
 
-            def article_event_stream():
-                import time
-                classification = {
+            meta_frame = _sse({
+                "type": "meta",
+                "classification": {
                     "category": article_match["category"],
                     "intent": "معلومة",
                     "urgency": "عادي",
                     "needs_deadline_check": False,
                     "all_categories": [article_match["category"]],
                     "source": "article_lookup",
-                }
-                meta = json.dumps({
-                    "type": "meta",
-                    "classification": classification,
-                    "sources": article_match["sources"],
-                    "has_deadlines": False,
-                }, ensure_ascii=False)
-                yield f"data: {meta}\n\n"
+                },
+                "sources": article_match["sources"],
+                "has_deadlines": False,
+            })
+
+            async def article_event_stream():
+                yield meta_frame
 
                 answer = article_match["response"]
                 paragraphs = answer.split("\n\n")
                 for i, para in enumerate(paragraphs):
                     text = para if i == 0 else f"\n\n{para}"
-                    chunk = json.dumps({"type": "token", "text": text}, ensure_ascii=False)
-                    yield f"data: {chunk}\n\n"
-                    time.sleep(0.02)
+                    yield _sse_token(text)
+                    await asyncio.sleep(0.02)
 
-                yield f"data: {json.dumps({'type': 'done'})}\n\n"
+                yield _SSE_DONE
 
             return StreamingResponse(
                 article_event_stream(),
@@ -436,42 +660,44 @@ async def ask_question_stream(req: QuestionRequest, request: Request):
                 headers={"Cache-Control": "no-cache", "Connection": "keep-alive", "X-Accel-Buffering": "no"},
             )
 
-    # === Tier 2.5: Response cache (cached Claude responses) ===
-    if not req.chat_history:
-        from backend.rag.qa_cache import get_cached_response
-        cached = get_cached_response(req.question, req.model_mode or "1.1")
-        if cached:
-            log.info("Response cache hit [stream]")
-
-            def response_cache_stream():
-                import time
-                meta = json.dumps({
-                    "type": "meta",
-                    "classification": cached["classification"],
-                    "sources": cached["sources"],
-                    "has_deadlines": cached["classification"].get("needs_deadline_check", False),
-                }, ensure_ascii=False)
-                yield f"data: {meta}\n\n"
-
-                answer = cached["answer"]
-                paragraphs = answer.split("\n\n")
-                for i, para in enumerate(paragraphs):
-                    text = para if i == 0 else f"\n\n{para}"
-                    chunk = json.dumps({"type": "token", "text": text}, ensure_ascii=False)
-                    yield f"data: {chunk}\n\n"
-                    time.sleep(0.02)
+    # === Tier 2.5: Response cache (cached Claude responses, follow-ups included) ===
+    cached = get_cached_response(req.question, req.model_mode or "1.1", req.chat_history)
+    if cached:
+        await _charge_question(user_id, await access, count_usage=True)
+        log.info("Response cache hit [stream]")
 
-                yield f"data: {json.dumps({'type': 'done'})}\n\n"
+        meta_frame = _sse({
+            "type": "meta",
+            "classification": cached["classification"],
+            "sources": cached["sources"],
+            "has_deadlines": cached["classification"].get("needs_deadline_check", False),
+        })
 
-            return StreamingResponse(
-                response_cache_stream(),
-                media_type="text/event-stream",
-                headers={"Cache-Control": "no-cache", "Connection": "keep-alive", "X-Accel-Buffering": "no"},
-            )
+        async def response_cache_stream():
+            yield meta_frame
+
+            answer = cached["answer"]
+            paragraphs = answer.split("\n\n")
+            for i, para in enumerate(paragraphs):
+                text = para if i == 0 else f"\n\n{para}"
+                yield _sse_token(text)
+                await asyncio.sleep(0.02)
+
+            yield _SSE_DONE
+
+        return StreamingResponse(
+            response_cache_stream(),
+            media_type="text/event-stream",
+            headers={
+                "Cache-Control": "no-cache",
+                "Connection": "keep-alive",
+                "X-Accel-Buffering": "no",
+                "X-Cache": "HIT",
+            },
+        )
 
     # === Tier 3: Claude API (full RAG + LLM) ===
     # Pre-classify for smart routing and context optimization
-    from backend.rag.classifier import classify_query
     pre_class = classify_query(req.question)
 
     # Smart model routing: simple factual → mode 1.1 (saves ~62% tokens)
@@ -483,69 +709,112 @@ async def ask_question_stream(req: QuestionRequest, request: Request):
         effective_mode = "1.1"
         log.info("Smart routing [stream]: 2.1→1.1 (intent=معلومة)")
 
-    # Reduce RAG context for simple questions
-    top_k = 3 if pre_class["intent"] == "معلومة" else 5
-    rag_result = retrieve_context(req.question, top_k=top_k, chat_history=req.chat_history)
-
-    # Capture request params for use in generator closure
-    _question = req.question
-    _chat_history = req.chat_history
-    _model_mode = effective_mode
+    # Shed load before retrieval when every Claude stream slot is taken
+    if _stream_slots.locked():
+        await access  # denied requests still get their 429/403
+        raise HTTPException(
+            status_code=503,
+            detail="الخادم مشغول — يرجى المحاولة مرة أخرى بعد لحظات",
+        )
+    # Nothing has yielded since locked(), so this takes the slot without
+    # waiting; it is released once produce() finishes (or on error below)
+    await _stream_slots.acquire()
 
-    def event_stream():
-        # Send metadata first (classification + sources)
-        meta = json.dumps({
+    try:
+        # Reduce RAG context for simple questions
+        top_k = 3 if pre_class["intent"] == "معلومة" else 5
+        rag_result = await _retrieve_after_access(
+            access, req.question, top_k=top_k, chat_history=req.chat_history,
+        )
+        await _charge_question(user_id, access.result(), count_usage=True)
+
+        # Capture request params for use in generator closure
+        _question = req.question
+        _chat_history = req.chat_history
+        _model_mode = effective_mode
+        _classification = rag_result["classification"]
+        _sources = rag_result["sources"]
+
+        # Claude writes into a buffer from a background task; this connection (and
+        # any reconnect via /api/ask-stream/{id} with Last-Event-ID) replays it
+        buf = create_stream(owner=user_id)
+
+        # Metadata first (classification + sources), buffered before the response
+        # starts so it goes out with the headers
+        await buf.append(_sse({
             "type": "meta",
-            "classification": rag_result["classification"],
-            "sources": rag_result["sources"],
-            "has_deadlines": rag_result["classification"].get("needs_deadline_check", False),
-        }, ensure_ascii=False)
-        yield f"data: {meta}\n\n"
-
-        # Stream Claude response token by token
+            "classification": _classification,
+            "sources": _sources,
+            "has_deadlines": _classification.get("needs_deadline_check", False),
+        }))
+    except BaseException:
+        _stream_slots.release()
+        raise
+
+    async def produce():
+        # Stream Claude response; tokens arriving together share one frame
         accumulated_tokens = []
         try:
-            for token in stream_legal_response(
+            async for text in coalesce_tokens(stream_legal_response(
                 question=_question,
                 context=rag_result["context"],
-                classification=rag_result["classification"],
+                classification=_classification,
                 chat_history=_chat_history,
                 model_mode=_model_mode,
-            ):
-                accumulated_tokens.append(token)
-                chunk = json.dumps({"type": "token", "text": token}, ensure_ascii=False)
-                yield f"data: {chunk}\n\n"
+            )):
+                accumulated_tokens.append(text)
+                await buf.append(_sse_token(text))
 
             # Signal completion
-            yield f"data: {json.dumps({'type': 'done'})}\n\n"
+            await buf.append(_SSE_DONE)
 
-            # Cache response for future reuse (only first questions)
-            if not _chat_history and accumulated_tokens:
-                from backend.rag.qa_cache import cache_response
+            # Cache response for future reuse (keyed by question, mode and history)
+            if accumulated_tokens:
                 full_response = "".join(accumulated_tokens)
                 cache_response(
-                    _question, _model_mode, full_response,
-                    rag_result["classification"], rag_result["sources"],
+                    _question, _model_mode, full_response, _classification, _sources,
+                    _chat_history,
                 )
                 log.info("Response cached [stream]: %s...", _question[:50])
 
         except Exception as e:
-            log.exception("Streaming error")
+            _log_stream_error("Streaming error", e)
             # Show user-friendly Arabic error instead of raw API errors
-            error_msg = str(e)
-            if "rate_limit" in error_msg.lower() or "429" in error_msg:
-                user_error = "الخادم مشغول حالياً — يرجى الانتظار بضع ثوانٍ ثم إعادة المحاولة"
-            elif "overloaded" in error_msg.lower() or "529" in error_msg:
-                user_error = "الخادم مشغول — يرجى المحاولة مرة أخرى بعد لحظات"
-            elif "api_key" in error_msg.lower() or "auth" in error_msg.lower():
-                user_error = "خطأ في إعدادات النظام — يرجى التواصل مع الإدارة"
-            else:
-                user_error = "حدث خطأ أثناء معالجة طلبك — يرجى المحاولة مرة أخرى"
-            error = json.dumps({"type": "error", "message": user_error}, ensure_ascii=False)
-            yield f"data: {error}\n\n"
+            await buf.append(_error_frame(e, _ASK_STREAM_ERRORS, _ERR_ASK_GENERIC))
+        finally:
+            await buf.close()
+
+    buf.task = asyncio.create_task(produce())
+    # A done callback also runs if the task is cancelled before it starts
+    buf.task.add_done_callback(lambda _: _stream_slots.release())
 
     return StreamingResponse(
-        event_stream(),
+        buf.follow(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",
+            "X-Stream-ID": buf.stream_id,
+            "X-Cache": "MISS",
+        },
+    )
+
+
+@app.get("/api/ask-stream/{stream_id}")
+async def resume_question_stream(stream_id: str, request: Request):
+    """Resume an /api/ask-stream answer after a dropped connection.
+
+    Replays the frames after the Last-Event-ID header (all of them without
+    it), then follows the live answer if it is still being generated.
+    """
+    buf = get_stream(stream_id)
+    if buf is None or buf.owner != request.state.user_id:
+        raise HTTPException(status_code=404, detail="انتهت صلاحية الإجابة — يرجى إعادة إرسال السؤال")
+
+    start = buf.resume_index(request.headers.get("last-event-id"))
+    return StreamingResponse(
+        buf.follow(start),
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
@@ -555,6 +824,24 @@ async def ask_question_stream(req: QuestionRequest, request: Request):
     )
 
 
+def _search_hits(results: dict, i: int = 0) -> list[dict]:
+    """Format the i-th query's ChromaDB results for the search endpoints."""
+    if not results["documents"] or not results["documents"][i]:
+        return []
+    # One vectorized pass instead of a round() per hit (top_k may be large)
+    similarities = np.round(1.0 - np.asarray(results["distances"][i], dtype=np.float64), 3).tolist()
+    return [
+        {
+            "text": doc,
+            "chapter": meta.get("chapter", ""),
+            "section": meta.get("section", ""),
+            "topic": meta.get("topic", ""),
+            "similarity": similarity,
+        }
+        for doc, meta, similarity in zip(results["documents"][i], results["metadatas"][i], similarities)
+    ]
+
+
 @app.post("/api/search")
 async def search_articles(req: SearchRequest):
     """Search law articles."""
@@ -564,33 +851,47 @@ async def search_articles(req: SearchRequest):
             detail="جاري تجهيز قاعدة البيانات... يرجى المحاولة بعد دقيقة"
         )
 
-    from backend.rag.embeddings import embed_query_list
-    from backend.rag.vector_store import search
+    where_filter = None
+    if req.topic:
+        where_filter = {"topic": {"$eq": req.topic}}
+
+    # Concurrent searches share one embedding pass and ChromaDB query
+    results = await search_batcher.search(req.query, n_results=req.top_k, where=where_filter)
+
+    articles = _search_hits(results)
+    return {"query": req.query, "results": articles, "total": len(articles)}
+
+
+MAX_BATCH_QUERIES = 20
+
+
+@app.post("/api/search/batch")
+async def search_articles_batch(req: SearchBatchRequest):
+    """Search law articles for several queries at once (one embedding pass, one ChromaDB query)."""
+    if not _db_ready:
+        raise HTTPException(
+            status_code=503,
+            detail="جاري تجهيز قاعدة البيانات... يرجى المحاولة بعد دقيقة"
+        )
+    if not req.queries or len(req.queries) > MAX_BATCH_QUERIES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"يجب إرسال من 1 إلى {MAX_BATCH_QUERIES} استعلاماً",
+        )
 
-    query_embedding = embed_query_list(req.query)
+    embeddings = await embed_queries_async(req.queries)
 
     where_filter = None
     if req.topic:
         where_filter = {"topic": {"$eq": req.topic}}
 
-    results = search(query_embedding, n_results=req.top_k, where=where_filter)
-
-    articles = []
-    if results["documents"] and results["documents"][0]:
-        for doc, meta, dist in zip(
-            results["documents"][0],
-            results["metadatas"][0],
-            results["distances"][0],
-        ):
-            articles.append({
-                "text": doc,
-                "chapter": meta.get("chapter", ""),
-                "section": meta.get("section", ""),
-                "topic": meta.get("topic", ""),
-                "similarity": round(1 - dist, 3),
-            })
+    results = await asyncio.to_thread(search_batch, embeddings, n_results=req.top_k, where=where_filter)
 
-    return {"query": req.query, "results": articles, "total": len(articles)}
+    batches = []
+    for i, query in enumerate(req.queries):
+        articles = _search_hits(results, i)
+        batches.append({"query": query, "results": articles, "total": len(articles)})
+    return {"batches": batches}
 
 
 # ══════════════════════════════════════════════════════════════
@@ -604,15 +905,6 @@ async def analyze_contract_stream(request: Request):
     Accepts multipart/form-data with file (PDF/DOCX) or contract_text field.
     Returns SSE stream with same protocol as /api/ask-stream.
     """
-    from backend.rag.pipeline import retrieve_context
-    from backend.services.contract_analyzer import (
-        extract_text_from_pdf,
-        extract_text_from_docx,
-        detect_contract_type,
-        stream_contract_analysis,
-        CONTRACT_RAG_QUERIES,
-    )
-    from backend.services.subscription import check_limit, increment_usage, get_user_subscription
 
     if not _db_ready:
         raise HTTPException(
@@ -621,7 +913,7 @@ async def analyze_contract_stream(request: Request):
         )
 
     # 1. Auth check
-    user_id = _get_user_id(request)
+    user_id = request.state.user_id
     if not user_id:
         raise HTTPException(status_code=401, detail="يجب تسجيل الدخول لاستخدام تحليل العقود")
 
@@ -652,11 +944,11 @@ async def analyze_contract_stream(request: Request):
             if filename.lower().endswith(".pdf"):
                 if not file_bytes[:5].startswith(b"%PDF"):
                     raise HTTPException(status_code=400, detail="الملف ليس PDF صالحاً")
-                contract_text = extract_text_from_pdf(file_bytes)
+                contract_text = await asyncio.to_thread(extract_text_from_pdf, file_bytes)
             elif filename.lower().endswith(".docx"):
                 if not file_bytes[:4].startswith(b"PK\x03\x04"):
                     raise HTTPException(status_code=400, detail="الملف ليس DOCX صالحاً")
-                contract_text = extract_text_from_docx(file_bytes)
+                contract_text = await asyncio.to_thread(extract_text_from_docx, file_bytes)
             else:
                 # Try as plain text (only allow text-like content)
                 try:
@@ -683,43 +975,36 @@ async def analyze_contract_stream(request: Request):
 
     # 5. RAG — retrieve relevant articles
     rag_query = CONTRACT_RAG_QUERIES.get(contract_type, CONTRACT_RAG_QUERIES["عام"])
-    rag_result = retrieve_context(rag_query, top_k=8)
+    rag_result = await asyncio.to_thread(retrieve_context, rag_query, top_k=8)
 
     # 6. Increment usage before streaming
     await increment_usage(user_id, "contract_analyses")
 
     # 7. Stream analysis
-    def event_stream():
+    meta_frame = _sse({
+        "type": "meta",
+        "contract_type": contract_type,
+        "sources": rag_result.get("sources", []),
+    })
+
+    async def event_stream():
         try:
-            # Meta event
-            meta = json.dumps({
-                "type": "meta",
-                "contract_type": contract_type,
-                "sources": rag_result.get("sources", []),
-            }, ensure_ascii=False)
-            yield f"data: {meta}\n\n"
+            yield meta_frame
 
-            # Token-by-token streaming
-            for token in stream_contract_analysis(
+            # Claude tokens, merged per 20 ms
+            async for text in coalesce_tokens(stream_contract_analysis(
                 contract_text=contract_text,
                 context=rag_result["context"],
                 contract_type=contract_type,
-            ):
-                chunk = json.dumps({"type": "token", "text": token}, ensure_ascii=False)
-                yield f"data: {chunk}\n\n"
+            )):
+                yield _sse_token(text)
 
             # Done
-            yield f"data: {json.dumps({'type': 'done'})}\n\n"
+            yield _SSE_DONE
 
         except Exception as e:
-            log.exception("Contract analysis streaming error")
-            error_msg = str(e)
-            if "rate_limit" in error_msg.lower() or "429" in error_msg:
-                user_error = "الخادم مشغول حالياً — يرجى المحاولة بعد لحظات"
-            else:
-                user_error = "حدث خطأ أثناء تحليل العقد — يرجى المحاولة مرة أخرى"
-            error = json.dumps({"type": "error", "message": user_error}, ensure_ascii=False)
-            yield f"data: {error}\n\n"
+            _log_stream_error("Contract analysis streaming error", e)
+            yield _error_frame(e, _BUSY_ERRORS, _ERR_CONTRACT_GENERIC)
 
     return StreamingResponse(
         event_stream(),
@@ -743,13 +1028,6 @@ async def predict_verdict_stream(request: Request):
     Accepts form data: case_type (optional) + case_details (required).
     Returns SSE stream with same protocol as /api/ask-stream.
     """
-    from backend.rag.pipeline import retrieve_context
-    from backend.services.verdict_predictor import (
-        detect_case_type,
-        stream_verdict_prediction,
-        CASE_RAG_QUERIES,
-    )
-    from backend.services.subscription import check_limit, increment_usage
 
     if not _db_ready:
         raise HTTPException(
@@ -758,7 +1036,7 @@ async def predict_verdict_stream(request: Request):
         )
 
     # 1. Auth check
-    user_id = _get_user_id(request)
+    user_id = request.state.user_id
     if not user_id:
         raise HTTPException(status_code=401, detail="يجب تسجيل الدخول لاستخدام توقع الحكم")
 
@@ -790,43 +1068,36 @@ async def predict_verdict_stream(request: Request):
 
     # 5. RAG — retrieve relevant articles
     rag_query = CASE_RAG_QUERIES.get(case_type, CASE_RAG_QUERIES["عام"])
-    rag_result = retrieve_context(rag_query, top_k=8)
+    rag_result = await asyncio.to_thread(retrieve_context, rag_query, top_k=8)
 
     # 6. Increment usage before streaming
     await increment_usage(user_id, "verdict_predictions")
 
     # 7. Stream prediction
-    def event_stream():
+    meta_frame = _sse({
+        "type": "meta",
+        "case_type": case_type,
+        "sources": rag_result.get("sources", []),
+    })
+
+    async def event_stream():
         try:
-            # Meta event
-            meta = json.dumps({
-                "type": "meta",
-                "case_type": case_type,
-                "sources": rag_result.get("sources", []),
-            }, ensure_ascii=False)
-            yield f"data: {meta}\n\n"
+            yield meta_frame
 
-            # Token-by-token streaming
-            for token in stream_verdict_prediction(
+            # Claude tokens, merged per 20 ms
+            async for text in coalesce_tokens(stream_verdict_prediction(
                 case_text=case_details,
                 context=rag_result["context"],
                 case_type=case_type,
-            ):
-                chunk = json.dumps({"type": "token", "text": token}, ensure_ascii=False)
-                yield f"data: {chunk}\n\n"
+            )):
+                yield _sse_token(text)
 
             # Done
-            yield f"data: {json.dumps({'type': 'done'})}\n\n"
+            yield _SSE_DONE
 
         except Exception as e:
-            log.exception("Verdict prediction streaming error")
-            error_msg = str(e)
-            if "rate_limit" in error_msg.lower() or "429" in error_msg:
-                user_error = "الخادم مشغول حالياً — يرجى المحاولة بعد لحظات"
-            else:
-                user_error = "حدث خطأ أثناء توقع الحكم — يرجى المحاولة مرة أخرى"
-            error = json.dumps({"type": "error", "message": user_error}, ensure_ascii=False)
-            yield f"data: {error}\n\n"
+            _log_stream_error("Verdict prediction streaming error", e)
+            yield _error_frame(e, _BUSY_ERRORS, _ERR_VERDICT_GENERIC)
 
     return StreamingResponse(
         event_stream(),
@@ -839,74 +1110,57 @@ async def predict_verdict_stream(request: Request):
     )
 
 
-@app.get("/api/articles")
-async def get_all_articles():
-    """Get all articles grouped by chapter."""
-    from backend.config import ARTICLES_JSON_PATH
-
-    if not os.path.exists(ARTICLES_JSON_PATH):
+def _articles_etag() -> str:
+    """ETag of articles.json; its stat call doubles as the existence check."""
+    try:
+        return get_data_etag()
+    except FileNotFoundError:
         raise HTTPException(status_code=404, detail="ملف المواد غير موجود")
 
-    with open(ARTICLES_JSON_PATH, "r", encoding="utf-8") as f:
-        data = json.load(f)
-
-    # Group by chapter
-    chapters = {}
-    for article in data["articles"]:
-        ch = article.get("chapter", "غير محدد")
-        if ch not in chapters:
-            chapters[ch] = {
-                "chapter": ch,
-                "sections": {},
-                "count": 0,
-            }
-        section = article.get("section", "غير محدد")
-        if section not in chapters[ch]["sections"]:
-            chapters[ch]["sections"][section] = []
-        chapters[ch]["sections"][section].append({
-            "id": article["id"],
-            "text": article["text"][:300] + "..." if len(article["text"]) > 300 else article["text"],
-            "topic": article.get("topic", ""),
-            "topic_tags": article.get("topic_tags", []),
-        })
-        chapters[ch]["count"] += 1
 
-    return {
-        "law_name": data.get("law_name", ""),
-        "royal_decree": data.get("royal_decree", ""),
-        "total_articles": data.get("total_chunks", 0),
-        "structure": data.get("structure", {}),
-        "chapters": chapters,
-    }
+@app.get("/api/articles")
+async def get_all_articles(
+    request: Request,
+    chapter: Optional[str] = None,
+    section: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+):
+    """Get one page of articles, optionally filtered by chapter/section."""
+    etag = _articles_etag()
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": _CACHE_REVALIDATE})
+
+    meta = get_meta()
+    items_json, count, total = get_articles_json(chapter, section, limit, offset)
+    next_offset = offset + count
+    head = orjson.dumps({
+        "law_name": meta.get("law_name", ""),
+        "royal_decree": meta.get("royal_decree", ""),
+        "total_articles": meta.get("total_chunks", 0),
+        "structure": meta.get("structure", {}),
+        "total": total,
+        "next_offset": next_offset if next_offset < total else None,
+    })
+    # items_json is already serialized by SQLite — splice it in as the last key
+    body = head[:-1] + b',"items":' + items_json + b"}"
+    return _json_with_etag(request, body, etag, _CACHE_REVALIDATE)
 
 
 @app.get("/api/articles/topics")
-async def get_topics():
+async def get_topics(request: Request):
     """Get available topics."""
-    from backend.config import ARTICLES_JSON_PATH
-
-    with open(ARTICLES_JSON_PATH, "r", encoding="utf-8") as f:
-        data = json.load(f)
-
-    topics = {}
-    for article in data["articles"]:
-        t = article.get("topic", "غير محدد")
-        topics[t] = topics.get(t, 0) + 1
-
-    return {"topics": [{"name": k, "count": v} for k, v in sorted(topics.items(), key=lambda x: -x[1])]}
+    etag = _articles_etag()
+    return _json_with_etag(request, get_topics_json(), etag, _CACHE_REVALIDATE)
 
 
 @app.post("/api/draft")
 async def draft_document(req: DraftRequest, request: Request):
     """Draft a legal document."""
-    from backend.services.document_drafter import validate_draft_request, build_drafting_prompt, get_draft_types
-    from backend.rag.pipeline import retrieve_context
-    from backend.services.legal_assistant import generate_draft
 
     # Check subscription limits
-    user_id = _get_user_id(request)
+    user_id = request.state.user_id
     if user_id:
-        from backend.services.subscription import check_limit, increment_usage
         allowed, msg = await check_limit(user_id, "drafts")
         if not allowed:
             raise HTTPException(status_code=429, detail=msg)
@@ -916,10 +1170,10 @@ async def draft_document(req: DraftRequest, request: Request):
         raise HTTPException(status_code=400, detail=error)
 
     prompt = build_drafting_prompt(req.draft_type, req.case_details)
-    rag_result = retrieve_context(prompt)
+    rag_result = await asyncio.to_thread(retrieve_context, prompt)
 
     try:
-        draft = generate_draft(req.draft_type, req.case_details, rag_result["context"])
+        draft = await asyncio.to_thread(generate_draft, req.draft_type, req.case_details, rag_result["context"])
     except ValueError as e:
         log.error("Draft ValueError: %s", e)
         raise HTTPException(status_code=500, detail="حدث خطأ أثناء صياغة المذكرة — يرجى المحاولة مرة أخرى")
@@ -938,27 +1192,29 @@ async def draft_document(req: DraftRequest, request: Request):
     }
 
 
+# DRAFT_TYPES is static, so the response body is serialized once
+_DRAFT_TYPES_JSON = orjson.dumps({"types": get_draft_types()})
+_DRAFT_TYPES_ETAG = _static_etag(_DRAFT_TYPES_JSON)
+
+
 @app.get("/api/draft/types")
-async def get_draft_types_endpoint():
+async def get_draft_types_endpoint(request: Request):
     """Get available draft types."""
-    from backend.services.document_drafter import get_draft_types
-    return {"types": get_draft_types()}
+    return _json_with_etag(request, _DRAFT_TYPES_JSON, _DRAFT_TYPES_ETAG, _CACHE_STATIC)
 
 
 @app.post("/api/deadline")
 async def calculate_deadline(req: DeadlineRequest, request: Request):
     """Calculate legal deadlines."""
-    from backend.services.deadline_calculator import calculate_deadline as calc
 
     # Check subscription limits
-    user_id = _get_user_id(request)
+    user_id = request.state.user_id
     if user_id:
-        from backend.services.subscription import check_limit, increment_usage
         allowed, msg = await check_limit(user_id, "deadlines")
         if not allowed:
             raise HTTPException(status_code=429, detail=msg)
 
-    result = calc(req.event_type, req.event_date, req.details)
+    result = await asyncio.to_thread(compute_deadline, req.event_type, req.event_date, req.details)
     if "error" in result:
         raise HTTPException(status_code=400, detail=result["error"])
 
@@ -969,18 +1225,22 @@ async def calculate_deadline(req: DeadlineRequest, request: Request):
     return result
 
 
+_DEADLINE_TYPES_JSON = orjson.dumps({
+    "types": [
+        {"type": "divorce", "name": "طلاق", "description": "حساب عدة الطلاق ومهل المراجعة"},
+        {"type": "death", "name": "وفاة", "description": "حساب عدة الوفاة"},
+        {"type": "judgment", "name": "حكم قضائي", "description": "حساب مهل الاعتراض"},
+        {"type": "custody", "name": "حضانة", "description": "مواعيد متعلقة بالحضانة"},
+        {"type": "appeal", "name": "استئناف", "description": "حساب مهل الاستئناف والنقض"},
+    ]
+})
+_DEADLINE_TYPES_ETAG = _static_etag(_DEADLINE_TYPES_JSON)
+
+
 @app.get("/api/deadline/types")
-async def get_deadline_types():
+async def get_deadline_types(request: Request):
     """Get available deadline event types."""
-    return {
-        "types": [
-            {"type": "divorce", "name": "طلاق", "description": "حساب عدة الطلاق ومهل المراجعة"},
-            {"type": "death", "name": "وفاة", "description": "حساب عدة الوفاة"},
-            {"type": "judgment", "name": "حكم قضائي", "description": "حساب مهل الاعتراض"},
-            {"type": "custody", "name": "حضانة", "description": "مواعيد متعلقة بالحضانة"},
-            {"type": "appeal", "name": "استئناف", "description": "حساب مهل الاستئناف والنقض"},
-        ]
-    }
+    return _json_with_etag(request, _DEADLINE_TYPES_JSON, _DEADLINE_TYPES_ETAG, _CACHE_STATIC)
 
 
 # --- Feedback & Analytics Endpoints ---
@@ -988,7 +1248,6 @@ async def get_deadline_types():
 @app.post("/api/feedback")
 async def submit_feedback(req: FeedbackRequest):
     """Submit feedback (thumbs up/down) on an AI response."""
-    from backend.db import get_supabase
 
     if req.rating not in ("positive", "negative"):
         raise HTTPException(status_code=400, detail="التقييم يجب أن يكون positive أو negative")
@@ -1005,39 +1264,30 @@ async def submit_feedback(req: FeedbackRequest):
     if not sb:
         raise HTTPException(status_code=503, detail="خدمة التقييم غير متوفرة حالياً")
 
-    try:
-        result = sb.table("message_feedback").upsert({
-            "message_id": req.message_id,
-            "conversation_id": req.conversation_id,
-            "rating": req.rating,
-            "feedback_type": req.feedback_type,
-            "correction_text": req.correction_text,
-        }, on_conflict="message_id").execute()
-
-        return {"status": "ok", "message": "تم تسجيل التقييم بنجاح"}
-    except Exception as e:
-        log.error("Feedback error: %s", e)
-        raise HTTPException(status_code=500, detail="حدث خطأ أثناء تسجيل التقييم")
+    # Written in the background, batched with other feedback (one upsert per flush)
+    feedback_batcher.submit({
+        "message_id": req.message_id,
+        "conversation_id": req.conversation_id,
+        "rating": req.rating,
+        "feedback_type": req.feedback_type,
+        "correction_text": req.correction_text,
+    })
+    return {"status": "ok", "message": "تم تسجيل التقييم بنجاح"}
 
 
 @app.post("/api/analytics/event")
 async def log_analytics_event(req: AnalyticsEventRequest):
     """Log an analytics event (fire-and-forget)."""
-    from backend.db import get_supabase
 
     sb = get_supabase()
     if not sb:
         return {"status": "skipped"}  # Silently skip if Supabase not configured
 
-    try:
-        sb.table("analytics_events").insert({
-            "event_type": req.event_type,
-            "event_data": req.event_data or {},
-        }).execute()
-        return {"status": "ok"}
-    except Exception as e:
-        log.warning("Analytics event error: %s", e)
-        return {"status": "error"}  # Don't fail the request for analytics
+    analytics_batcher.submit({
+        "event_type": req.event_type,
+        "event_data": req.event_data or {},
+    })
+    return {"status": "ok"}
 
 
 # --- Subscription & Payment Endpoints ---
@@ -1045,7 +1295,6 @@ async def log_analytics_event(req: AnalyticsEventRequest):
 @app.get("/api/plans")
 async def get_plans():
     """Get all available subscription plans (public endpoint)."""
-    from backend.services.subscription import get_all_plans
     plans = await get_all_plans()
     return {"plans": plans}
 
@@ -1053,11 +1302,10 @@ async def get_plans():
 @app.get("/api/subscription")
 async def get_subscription(request: Request):
     """Get current user's subscription details."""
-    user_id = _get_user_id(request)
+    user_id = request.state.user_id
     if not user_id:
         raise HTTPException(status_code=401, detail="يجب تسجيل الدخول")
 
-    from backend.services.subscription import get_user_subscription
     sub = await get_user_subscription(user_id)
     return sub
 
@@ -1065,11 +1313,10 @@ async def get_subscription(request: Request):
 @app.post("/api/subscription/create")
 async def create_subscription(req: SubscriptionCreateRequest, request: Request):
     """Create a subscription payment via Moyasar."""
-    user_id = _get_user_id(request)
+    user_id = request.state.user_id
     if not user_id:
         raise HTTPException(status_code=401, detail="يجب تسجيل الدخول")
 
-    from backend.services.payment import create_payment_form_data
 
     try:
         result = await create_payment_form_data(
@@ -1088,7 +1335,6 @@ async def create_subscription(req: SubscriptionCreateRequest, request: Request):
 @app.get("/api/subscription/verify")
 async def verify_subscription_payment(payment_id: str, tx_id: Optional[str] = None):
     """Verify a payment after 3DS redirect."""
-    from backend.services.payment import verify_payment
 
     try:
         result = await verify_payment(payment_id, tx_id)
@@ -1103,11 +1349,10 @@ async def verify_subscription_payment(payment_id: str, tx_id: Optional[str] = No
 @app.post("/api/subscription/cancel")
 async def cancel_sub(request: Request):
     """Cancel user's active subscription at end of period."""
-    user_id = _get_user_id(request)
+    user_id = request.state.user_id
     if not user_id:
         raise HTTPException(status_code=401, detail="يجب تسجيل الدخول")
 
-    from backend.services.payment import cancel_subscription
 
     try:
         result = await cancel_subscription(user_id)
@@ -1119,7 +1364,6 @@ async def cancel_sub(request: Request):
 @app.post("/api/subscription/webhook")
 async def subscription_webhook(request: Request):
     """Moyasar webhook callback (public — no auth required)."""
-    from backend.services.payment import handle_webhook
 
     try:
         payload_bytes = await request.body()
@@ -1129,7 +1373,7 @@ async def subscription_webhook(request: Request):
         return result
     except ValueError as e:
         log.warning("Webhook rejected: %s", e)
-        return JSONResponse(status_code=403, content={"status": "rejected", "reason": str(e)})
+        return ORJSONResponse(status_code=403, content={"status": "rejected", "reason": str(e)})
     except Exception as e:
         log.error("Webhook error: %s", e)
         return {"status": "error"}
@@ -1140,11 +1384,10 @@ async def subscription_webhook(request: Request):
 @app.post("/api/subscription/paypal/create-order")
 async def paypal_create_order(req: SubscriptionCreateRequest, request: Request):
     """Create a PayPal order for subscription payment."""
-    user_id = _get_user_id(request)
+    user_id = request.state.user_id
     if not user_id:
         raise HTTPException(status_code=401, detail="يجب تسجيل الدخول")
 
-    from backend.services.paypal import create_order
 
     try:
         result = await create_order(
@@ -1163,11 +1406,10 @@ async def paypal_create_order(req: SubscriptionCreateRequest, request: Request):
 @app.post("/api/subscription/paypal/capture-order")
 async def paypal_capture_order(request: Request):
     """Capture an approved PayPal order and activate subscription."""
-    user_id = _get_user_id(request)
+    user_id = request.state.user_id
     if not user_id:
         raise HTTPException(status_code=401, detail="يجب تسجيل الدخول")
 
-    from backend.services.paypal import capture_order
 
     try:
         body = await request.json()
@@ -1187,11 +1429,10 @@ async def paypal_capture_order(request: Request):
 @app.get("/api/usage")
 async def get_usage(request: Request):
     """Get current user's usage summary."""
-    user_id = _get_user_id(request)
+    user_id = request.state.user_id
     if not user_id:
         raise HTTPException(status_code=401, detail="يجب تسجيل الدخول")
 
-    from backend.services.subscription import get_user_usage_summary
     summary = await get_user_usage_summary(user_id)
     return summary
 
@@ -1201,8 +1442,7 @@ async def get_usage(request: Request):
 @app.get("/api/admin/stats")
 async def admin_stats(request: Request):
     """Get admin dashboard statistics."""
-    from backend.services.admin import check_admin, get_admin_stats
-    user_id = getattr(request.state, "user_id", None)
+    user_id = request.state.user_id
     if not user_id:
         raise HTTPException(403, "يجب تسجيل الدخول")
     if not await check_admin(user_id):
@@ -1213,8 +1453,7 @@ async def admin_stats(request: Request):
 @app.get("/api/admin/users")
 async def admin_users(request: Request, limit: int = 50, offset: int = 0):
     """Get paginated user list (admin only)."""
-    from backend.services.admin import check_admin, get_admin_users
-    user_id = getattr(request.state, "user_id", None)
+    user_id = request.state.user_id
     if not user_id:
         raise HTTPException(403, "يجب تسجيل الدخول")
     if not await check_admin(user_id):
@@ -1228,8 +1467,7 @@ async def admin_users(request: Request, limit: int = 50, offset: int = 0):
 @app.post("/api/admin/users/{target_user_id}/plan")
 async def admin_change_plan(target_user_id: str, request: Request):
     """Change a user's subscription plan (admin only)."""
-    from backend.services.admin import check_admin, update_user_subscription_admin
-    user_id = getattr(request.state, "user_id", None)
+    user_id = request.state.user_id
     if not user_id:
         raise HTTPException(403, "يجب تسجيل الدخول")
     if not await check_admin(user_id):
@@ -1255,8 +1493,7 @@ async def admin_change_plan(target_user_id: str, request: Request):
 @app.get("/api/admin/role")
 async def admin_get_my_role(request: Request):
     """Get current user's role."""
-    from backend.services.admin import get_user_role
-    user_id = getattr(request.state, "user_id", None)
+    user_id = request.state.user_id
     if not user_id:
         raise HTTPException(403, "يجب تسجيل الدخول")
     role = await get_user_role(user_id)
@@ -5,6 +5,8 @@ JWT Auth (primary):
   - Validates Supabase JWT from Authorization: Bearer <token>
   - Supports both ES256 (new JWKS-based) and HS256 (legacy secret-based)
   - Sets request.state.user_id and request.state.auth_method = "jwt"
+  - Verified payloads are cached for up to 60s (never past exp), keyed by a
+    hash of the token, so repeat requests skip signature checks
 
 API Key Auth (legacy fallback):
   - If X-API-Key matches API_KEY env, allows request with user_id=None
@@ -13,16 +15,28 @@ API Key Auth (legacy fallback):
 RequestID:
   - Assigns a unique request ID to each request for log tracing
 
+Compression:
+  - Gzips JSON responses, but never the SSE endpoints (*-stream, and the
+    /api/ask-stream/{id} resume route), where buffering would hold back tokens
+
 Usage limits are checked inside endpoint handlers (not here)
 because middleware cannot easily read request bodies with StreamingResponse.
 """
 from __future__ import annotations
 
+import base64
+import hashlib
+import time
 import uuid
+from collections import OrderedDict
+
 import jwt
+import orjson
 from jwt import PyJWKClient
 from fastapi import Request
 from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipMiddleware
 from starlette.responses import JSONResponse
 
 from backend.config import API_KEY, SUPABASE_JWT_SECRET, SUPABASE_URL
@@ -44,6 +58,23 @@ class SecurityHeadersMiddleware(BaseHTTPMiddleware):
         return response
 
 
+class StreamAwareGZipMiddleware:
+    """GZipMiddleware that passes the SSE endpoints (any path with "-stream") through.
+
+    Older Starlette releases gzip text/event-stream too, which buffers the
+    token stream; routing on the path keeps SSE uncompressed on any version.
+    """
+
+    def __init__(self, app, minimum_size: int = 1024):
+        self.app = app
+        self.gzip = GZipMiddleware(app, minimum_size=minimum_size)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and "-stream" not in scope["path"]:
+            return await self.gzip(scope, receive, send)
+        return await self.app(scope, receive, send)
+
+
 class RequestIDMiddleware(BaseHTTPMiddleware):
     """Assigns a unique request ID to each request for tracing."""
 
@@ -56,17 +87,30 @@ class RequestIDMiddleware(BaseHTTPMiddleware):
 
 
 # Paths that require no authentication at all
-PUBLIC_PATHS = {
+PUBLIC_PATHS = frozenset({
     "/api/health",
     "/api/plans",
     "/api/subscription/webhook",
     "/docs",
     "/openapi.json",
     "/redoc",
-}
+})
 
-# JWKS client for ES256 verification (caches keys automatically)
+# JWKS client for ES256 verification (caches the key set for JWKS_LIFESPAN)
 _jwks_client = None
+JWKS_LIFESPAN = 3600
+
+# Resolved signing keys per kid, dropped after JWKS_KEY_TTL seconds so a
+# rotated or revoked key stops verifying without a restart
+JWKS_KEY_TTL = 300
+_JWKS_KEYS_MAX = 16
+_es256_keys: dict[str | None, tuple[float, object]] = {}
+
+# HS256 secret as bytes, encoded once instead of on every decode
+_HS256_KEY = SUPABASE_JWT_SECRET.encode() if SUPABASE_JWT_SECRET else None
+
+# Claims every Supabase access token carries
+_DECODE_OPTIONS = {"require": ["exp", "sub"]}
 
 
 def _get_jwks_client() -> PyJWKClient | None:
@@ -76,47 +120,101 @@ def _get_jwks_client() -> PyJWKClient | None:
         return _jwks_client
     if SUPABASE_URL:
         jwks_url = f"{SUPABASE_URL.rstrip('/')}/auth/v1/.well-known/jwks.json"
-        _jwks_client = PyJWKClient(jwks_url, cache_keys=True, lifespan=3600)
+        _jwks_client = PyJWKClient(jwks_url, cache_keys=False, lifespan=JWKS_LIFESPAN)
         return _jwks_client
     return None
 
 
+# Raw header segment -> parsed header. Tokens from one project share a few
+# headers (alg, typ, kid), so after the first verified token the header is a
+# dict lookup instead of a base64 decode + JSON parse. Only headers of tokens
+# that verified are added, so the table stays as small as the set of kids.
+_KNOWN_HEADERS_MAX = 16
+_known_headers: dict[str, dict] = {}
+
+
+def _peek_header(token: str) -> dict:
+    """Unverified JWT header via base64url + orjson (lighter than jwt.get_unverified_header)."""
+    head = token.partition(".")[0].encode()
+    try:
+        header = orjson.loads(base64.urlsafe_b64decode(head + b"=" * (-len(head) % 4)))
+    except ValueError as e:  # bad base64, bad JSON or non-ASCII token
+        raise jwt.DecodeError("Invalid header padding or JSON") from e
+    if not isinstance(header, dict):
+        raise jwt.DecodeError("Invalid header string: must be a json object")
+    return header
+
+
+def _token_header(token: str) -> dict:
+    header = _known_headers.get(token.partition(".")[0])
+    return header if header is not None else _peek_header(token)
+
+
+def _remember_header(token: str, header: dict) -> None:
+    if len(_known_headers) < _KNOWN_HEADERS_MAX:
+        _known_headers[token.partition(".")[0]] = header
+
+
+def _es256_key(kid: str | None):
+    """Public key for a JWKS kid, reused for JWKS_KEY_TTL seconds.
+
+    PyJWKClient's own cache_keys is an lru_cache that never expires, so it is
+    off; its key-set cache (JWKS_LIFESPAN) still saves the HTTP fetch.
+    """
+    now = time.monotonic()
+    entry = _es256_keys.get(kid)
+    if entry is not None and entry[0] > now:
+        return entry[1]
+    key = _get_jwks_client().get_signing_key(kid).key
+    if kid not in _es256_keys and len(_es256_keys) >= _JWKS_KEYS_MAX:
+        del _es256_keys[next(iter(_es256_keys))]
+    _es256_keys[kid] = (now + JWKS_KEY_TTL, key)
+    return key
+
+
 def verify_jwt_token(token: str) -> dict:
     """
     Verify a Supabase JWT and return the decoded payload.
     Tries ES256 (JWKS) first, then falls back to HS256 (legacy secret).
+    The token header picks the method, so legacy HS256 tokens never make
+    a JWKS lookup (an unknown kid forces a JWKS refetch).
     Raises jwt.InvalidTokenError on failure.
     """
     errors = []
+    header = _token_header(token)
+    alg = header.get("alg")
 
     # --- Method 1: ES256 via JWKS (current Supabase default) ---
-    jwks = _get_jwks_client()
+    jwks = _get_jwks_client() if alg != "HS256" else None
     if jwks:
         try:
-            signing_key = jwks.get_signing_key_from_jwt(token)
             payload = jwt.decode(
                 token,
-                signing_key.key,
+                _es256_key(header.get("kid")),
                 algorithms=["ES256"],
                 audience="authenticated",
+                options=_DECODE_OPTIONS,
             )
             if not payload.get("sub"):
                 raise jwt.InvalidTokenError("Missing sub claim")
+            _remember_header(token, header)
             return payload
         except (jwt.InvalidTokenError, Exception) as e:
             errors.append(f"ES256/JWKS: {e}")
 
     # --- Method 2: HS256 with shared secret (legacy) ---
-    if SUPABASE_JWT_SECRET:
+    if _HS256_KEY and alg == "HS256":
         try:
             payload = jwt.decode(
                 token,
-                SUPABASE_JWT_SECRET,
+                _HS256_KEY,
                 algorithms=["HS256"],
                 audience="authenticated",
+                options=_DECODE_OPTIONS,
             )
             if not payload.get("sub"):
                 raise jwt.InvalidTokenError("Missing sub claim")
+            _remember_header(token, header)
             return payload
         except (jwt.InvalidTokenError, Exception) as e:
             errors.append(f"HS256: {e}")
@@ -127,52 +225,103 @@ def verify_jwt_token(token: str) -> dict:
     raise jwt.InvalidTokenError(" | ".join(errors))
 
 
-class JWTAuthMiddleware(BaseHTTPMiddleware):
+JWT_CACHE_TTL = 60  # seconds a verified token is trusted without re-checking
+JWT_CACHE_MAX = 10_000
+_JWT_CACHE_MIN_LIFE = 5  # tokens this close to exp are always verified
+
+# blake2b(token) -> (cache expiry, payload), least recently used first
+_jwt_cache: OrderedDict[bytes, tuple[float, dict]] = OrderedDict()
+
+
+def verify_jwt_token_cached(token: str) -> dict:
+    """verify_jwt_token, remembered for JWT_CACHE_TTL seconds or until exp.
+
+    Only successful verifications are cached, and verify_jwt_token rejects
+    tokens without exp or sub (_DECODE_OPTIONS), so every cached entry has
+    an exp to cap its lifetime. Tokens within _JWT_CACHE_MIN_LIFE of exp
+    are verified every time.
+    """
+    key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+    now = time.time()
+    hit = _jwt_cache.get(key)
+    if hit is not None:
+        if hit[0] > now:
+            _jwt_cache.move_to_end(key)
+            return hit[1]
+        del _jwt_cache[key]
+
+    payload = verify_jwt_token(token)
+    exp = payload.get("exp")
+    if isinstance(exp, (int, float)) and exp - now > _JWT_CACHE_MIN_LIFE:
+        _jwt_cache[key] = (min(now + JWT_CACHE_TTL, exp), payload)
+        while len(_jwt_cache) > JWT_CACHE_MAX:
+            _jwt_cache.popitem(last=False)
+    return payload
+
+
+class JWTAuthMiddleware:
     """
     JWT-based authentication middleware.
     Replaces the old AuthMiddleware + RateLimitMiddleware.
+
+    Pure ASGI (no BaseHTTPMiddleware task group per request): headers are
+    read straight from the scope, and the auth result goes into
+    scope["state"], which handlers see as request.state.
     """
 
-    async def dispatch(self, request: Request, call_next):
-        path = request.url.path
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        path = scope["path"]
+
+        # Always present, so handlers can read request.state.user_id directly
+        state = scope.setdefault("state", {})
+        state["user_id"] = None
+        state["email"] = None
+
+        # Skip auth for non-API routes and public paths
+        if not path.startswith("/api/") or path in PUBLIC_PATHS:
+            state["auth_method"] = "public"
+            return await self.app(scope, receive, send)
 
-        # Skip auth for public paths and non-API routes
-        if path in PUBLIC_PATHS or not path.startswith("/api/"):
-            request.state.user_id = None
-            request.state.auth_method = "public"
-            return await call_next(request)
+        headers = Headers(scope=scope)
 
         # Try JWT from Authorization header (primary method)
-        auth_header = request.headers.get("authorization", "")
+        auth_header = headers.get("authorization", "")
         if auth_header.startswith("Bearer "):
             token = auth_header[7:]
             try:
-                payload = verify_jwt_token(token)
-                request.state.user_id = payload["sub"]
-                request.state.email = payload.get("email", "")
-                request.state.auth_method = "jwt"
-                return await call_next(request)
+                payload = verify_jwt_token_cached(token)
             except jwt.ExpiredSignatureError:
-                return JSONResponse(
+                response = JSONResponse(
                     status_code=401,
                     content={"detail": "انتهت صلاحية الجلسة — سجّل الدخول مرة أخرى"},
                 )
             except jwt.InvalidTokenError:
-                return JSONResponse(
+                response = JSONResponse(
                     status_code=401,
                     content={"detail": "رمز مصادقة غير صالح — سجّل الدخول مرة أخرى"},
                 )
+            else:
+                state["user_id"] = payload["sub"]
+                state["email"] = payload.get("email", "")
+                state["auth_method"] = "jwt"
+                return await self.app(scope, receive, send)
+            return await response(scope, receive, send)
 
         # Fallback: API key authentication (header only — query params rejected for security)
-        api_key = request.headers.get("x-api-key")
+        api_key = headers.get("x-api-key")
         if api_key and API_KEY and api_key == API_KEY:
-            request.state.user_id = None
-            request.state.email = None
-            request.state.auth_method = "api_key"
-            return await call_next(request)
+            state["auth_method"] = "api_key"
+            return await self.app(scope, receive, send)
 
         # No valid auth provided
-        return JSONResponse(
+        response = JSONResponse(
             status_code=401,
             content={"detail": "يجب تسجيل الدخول — أضف Authorization: Bearer <token> في الهيدر"},
         )
+        await response(scope, receive, send)
@@ -0,0 +1,217 @@
+"""
+SQLite index of articles.json for the articles browser endpoints.
+
+articles.json stays the source of truth (it feeds the vector DB and is
+edited by the add_*_law.py / fix_duplicates.py scripts); articles.db is a
+derived, read-only copy with indexes on chapter, section and topic.
+It is built by the setup step (tools/setup_db.py, run in the Docker build,
+and by the lifespan fallback when the DB is missing or older than
+articles.json), never at request time: backend/data may be read-only in the
+container. Each process queries it through one read-only connection.
+"""
+from __future__ import annotations
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import orjson
+
+from backend.config import ARTICLES_DB_PATH, ARTICLES_JSON_PATH
+
+log = logging.getLogger("sanad.articles_db")
+
+# One read-only connection per process, shared by threads under _conn_lock.
+# Keyed by (pid, path, articles.db mtime) so a forked worker or a rebuilt
+# file gets a fresh connection instead of the old one.
+_conn: sqlite3.Connection | None = None
+_conn_key: tuple[int, str, int] | None = None
+_conn_lock = threading.Lock()
+
+# (articles.db path, name) -> (articles.db mtime, value)
+_cache: dict[tuple[str, str], tuple[int, object]] = {}
+
+_SCHEMA = """
+CREATE TABLE articles (
+    id TEXT PRIMARY KEY,
+    chapter TEXT NOT NULL,
+    section TEXT NOT NULL,
+    topic TEXT,
+    text TEXT NOT NULL,
+    text_preview TEXT NOT NULL,
+    topic_tags TEXT NOT NULL
+);
+CREATE INDEX idx_articles_chapter ON articles(chapter);
+CREATE INDEX idx_articles_section ON articles(chapter, section);
+CREATE INDEX idx_articles_topic ON articles(topic);
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+
+def build_articles_db(data: dict, db_path: str | None = None) -> None:
+    """Write articles.db from a parsed articles.json document.
+
+    Rows are inserted in file order, so ORDER BY rowid reproduces it.
+    The file is written next to db_path and swapped in atomically.
+    A missing topic is stored as NULL: items show it as "" and the topic
+    counts as "غير محدد", like the JSON-backed endpoints did.
+    """
+    from backend.data.extract_articles import preview_text  # build-time only (pulls in pypdfium2)
+
+    db_path = db_path or ARTICLES_DB_PATH
+    tmp_path = f"{db_path}.{os.getpid()}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.executescript(_SCHEMA)
+        conn.executemany(
+            "INSERT INTO articles VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                (
+                    a["id"],
+                    a.get("chapter", "غير محدد"),
+                    a.get("section", "غير محدد"),
+                    a.get("topic"),
+                    a["text"],
+                    a.get("text_preview") or preview_text(a["text"]),
+                    orjson.dumps(a.get("topic_tags", [])).decode(),
+                )
+                for a in data.get("articles", [])
+            ),
+        )
+        conn.executemany(
+            "INSERT INTO meta VALUES (?, ?)",
+            (
+                (key, orjson.dumps(value).decode())
+                for key, value in data.items() if key != "articles"
+            ),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp_path, db_path)
+
+
+def articles_db_is_stale() -> bool:
+    """True if articles.db is missing or older than articles.json."""
+    if not os.path.exists(ARTICLES_DB_PATH):
+        return True
+    return os.path.getmtime(ARTICLES_DB_PATH) < os.path.getmtime(ARTICLES_JSON_PATH)
+
+
+def ensure_articles_db() -> None:
+    """Setup step: (re)build articles.db from articles.json if it is stale."""
+    if not articles_db_is_stale():
+        return
+    with open(ARTICLES_JSON_PATH, "rb") as f:
+        data = orjson.loads(f.read())
+    build_articles_db(data)
+    log.info("articles.db built — %d articles", len(data.get("articles", [])))
+
+
+def _db_version() -> int:
+    try:
+        return os.stat(ARTICLES_DB_PATH).st_mtime_ns
+    except FileNotFoundError:
+        raise FileNotFoundError(
+            f"{ARTICLES_DB_PATH} not built — run python -m backend.tools.setup_db"
+        ) from None
+
+
+@contextmanager
+def _connection():
+    """This process's read-only connection to articles.db, held exclusively."""
+    global _conn, _conn_key
+    key = (os.getpid(), ARTICLES_DB_PATH, _db_version())
+    with _conn_lock:
+        if _conn_key != key:
+            # After a fork the inherited connection belongs to the parent; drop it unused
+            if _conn is not None and _conn_key[0] == key[0]:
+                _conn.close()
+            _conn = sqlite3.connect(
+                f"file:{ARTICLES_DB_PATH}?mode=ro", uri=True, check_same_thread=False,
+            )
+            _conn_key = key
+        yield _conn
+
+
+def get_data_etag() -> str:
+    """ETag for anything derived from articles.json — changes when the file does."""
+    st = os.stat(ARTICLES_JSON_PATH)
+    return f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+
+
+def _cached(name: str, build):
+    """Memoize build() until articles.db is rebuilt."""
+    key = (ARTICLES_DB_PATH, name)
+    version = _db_version()
+    hit = _cache.get(key)
+    if hit is not None and hit[0] == version:
+        return hit[1]
+    value = build()
+    _cache[key] = (version, value)
+    return value
+
+
+def _read_meta() -> dict:
+    with _connection() as conn:
+        return {key: orjson.loads(value) for key, value in conn.execute("SELECT key, value FROM meta")}
+
+
+def get_meta() -> dict:
+    """Top-level articles.json fields (law_name, total_chunks, structure, ...).
+
+    Cached until articles.db is rebuilt — treat the result as read-only.
+    """
+    return _cached("meta", _read_meta)
+
+
+def get_articles_json(
+    chapter: str | None = None,
+    section: str | None = None,
+    limit: int = 100,
+    offset: int = 0,
+) -> tuple[bytes, int, int]:
+    """One page of articles in file order, optionally filtered by chapter/section.
+
+    SQLite serializes each row with json_object, so the page goes from the
+    cursor to a JSON array without building a dict per article.
+    Returns (items JSON array, items on this page, total matching the filter).
+    """
+    where, params = [], []
+    if chapter:
+        where.append("chapter = ?")
+        params.append(chapter)
+    if section:
+        where.append("section = ?")
+        params.append(section)
+    clause = f" WHERE {' AND '.join(where)}" if where else ""
+
+    with _connection() as conn:
+        (total,) = conn.execute(f"SELECT COUNT(*) FROM articles{clause}", params).fetchone()
+        rows = conn.execute(
+            "SELECT json_object('id', id, 'chapter', chapter, 'section', section, "
+            "'text', text_preview, 'topic', COALESCE(topic, ''), 'topic_tags', json(topic_tags)) "
+            f"FROM articles{clause} ORDER BY rowid LIMIT ? OFFSET ?",
+            (*params, limit, offset),
+        ).fetchall()
+    items = ",".join(row for (row,) in rows)
+    return f"[{items}]".encode(), len(rows), total
+
+
+def get_topic_counts() -> list[dict]:
+    """Article count per topic, most common first (ties in file order)."""
+    with _connection() as conn:
+        rows = conn.execute(
+            "SELECT COALESCE(topic, 'غير محدد') AS name, COUNT(*) AS n FROM articles "
+            "GROUP BY name ORDER BY n DESC, MIN(rowid)"
+        ).fetchall()
+    return [{"name": topic, "count": n} for topic, n in rows]
+
+
+def get_topics_json() -> bytes:
+    """Serialized /api/articles/topics body, cached until articles.db is rebuilt."""
+    return _cached("topics_json", lambda: orjson.dumps({"topics": get_topic_counts()}))
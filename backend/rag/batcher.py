@@ -0,0 +1,95 @@
+"""
+Micro-batching for /api/search.
+
+Concurrent searches that arrive within a few milliseconds of each other are
+embedded in one encoder pass (embed_queries_async, which serves repeated
+queries from the query-embedding cache) and sent to ChromaDB
+as one multi-query call per top_k / filter combination, instead of one model
+call and one ANN query per request. A lone request waits at most
+FLUSH_SECONDS.
+"""
+from __future__ import annotations
+import asyncio
+import logging
+
+import orjson
+
+from backend.rag.embeddings import embed_queries_async
+from backend.rag.vector_store import search_batch
+
+log = logging.getLogger("sanad.batcher")
+
+FLUSH_SECONDS = 0.008
+MAX_BATCH = 16
+
+_RESULT_KEYS = ("ids", "documents", "metadatas", "distances")
+
+
+class SearchBatcher:
+    """Collects (query, n_results, where) searches and runs them in batches."""
+
+    def __init__(self, flush_seconds: float = FLUSH_SECONDS, max_batch: int = MAX_BATCH):
+        self.flush_seconds = flush_seconds
+        self.max_batch = max_batch
+        self._pending: list[tuple[str, int, dict | None, asyncio.Future]] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._running: set[asyncio.Task] = set()
+
+    async def search(self, query: str, n_results: int = 5, where: dict | None = None) -> dict:
+        """Same result shape as vector_store.search() for a single query."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((query, n_results, where, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.flush_seconds, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._run(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch: list[tuple[str, int, dict | None, asyncio.Future]]) -> None:
+        try:
+            embeddings = await embed_queries_async([query for query, *_ in batch])
+            results = await asyncio.to_thread(_search_many, [item[:3] for item in batch], embeddings)
+        except Exception as e:
+            log.exception("Batched search failed (%d queries)", len(batch))
+            for *_, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (*_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+
+def _search_many(
+    searches: list[tuple[str, int, dict | None]], embeddings: list[list[float]],
+) -> list[dict]:
+    """One ChromaDB query per (n_results, where) group of the embedded searches."""
+    groups: dict[tuple[int, bytes], list[int]] = {}
+    for i, (_, n_results, where) in enumerate(searches):
+        key = (n_results, orjson.dumps(where, option=orjson.OPT_SORT_KEYS))
+        groups.setdefault(key, []).append(i)
+
+    results: list[dict | None] = [None] * len(searches)
+    for indices in groups.values():
+        _, n_results, where = searches[indices[0]]
+        found = search_batch([embeddings[i] for i in indices], n_results=n_results, where=where)
+        for row, i in enumerate(indices):
+            results[i] = {
+                key: found[key][row:row + 1]
+                for key in _RESULT_KEYS if found.get(key) is not None
+            }
+    return results
+
+
+search_batcher = SearchBatcher()
@@ -3,6 +3,7 @@ Query classifier for legal questions.
 Classifies user questions to improve search relevance.
 """
 import re
+from functools import lru_cache
 
 CATEGORY_KEYWORDS = {
     "خطبة": ["خطبة", "خاطب", "مخطوبة", "عدول عن الخطبة", "هدايا الخطبة"],
@@ -92,7 +93,18 @@ INTENT_PATTERNS = {
 
 
 def classify_query(question: str) -> dict:
-    """Classify a legal question."""
+    """Classify a legal question.
+
+    Cached: /api/ask classifies for routing and retrieve_context classifies
+    again. Each caller gets its own copy, so mutating it can't leak into
+    later cache hits.
+    """
+    classification = _classify(question)
+    return {**classification, "all_categories": list(classification["all_categories"])}
+
+
+@lru_cache(maxsize=256)
+def _classify(question: str) -> dict:
     question_lower = question.strip()
 
     # Detect category
@@ -124,5 +136,5 @@ def classify_query(question: str) -> dict:
         "intent": intent,
         "urgency": urgency,
         "needs_deadline_check": needs_deadline,
-        "all_categories": list(category_scores.keys()) if category_scores else ["عام"],
+        "all_categories": tuple(category_scores) if category_scores else ("عام",),
     }
@@ -2,38 +2,261 @@
 Embedding service using sentence-transformers for Arabic text.
 Uses paraphrase-multilingual-MiniLM-L12-v2 locally — no API needed.
 Dimension: 384. Model loaded once, cached in memory (~120 MB).
+
+EMBED_BACKEND=onnx runs the same model through ONNX Runtime using the INT8
+(dynamically quantized) export published with it — about 3x faster on CPU
+and lighter than PyTorch FP32. Needs sentence-transformers>=3.2 and
+optimum[onnxruntime], which is kept out of the base image: install
+backend/requirements-onnx.txt to use it. Stored document vectors stay FP32; the quantized
+query vectors are close enough that rankings barely move.
 """
 from __future__ import annotations
+import asyncio
+import multiprocessing
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
 from functools import lru_cache
 
+import numpy as np
+
 _model = None
 MODEL_NAME = "paraphrase-multilingual-MiniLM-L12-v2"
 
+# "torch" (default) or "onnx"; EMBED_ONNX_FILE picks the export inside the model repo
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "torch")
+EMBED_ONNX_FILE = os.getenv("EMBED_ONNX_FILE", "onnx/model_qint8_avx512_vnni.onnx")
+
+# Intra-op threads per model (0 = library default, one per core). On a small
+# container 1 avoids oversubscription, especially with EMBED_PROCESSES > 1.
+EMBED_THREADS = int(os.getenv("EMBED_THREADS", "0"))
+
+# Worker processes for embed_query_batch_async (0 = a thread in this process).
+# Each worker loads its own copy of the model.
+EMBED_PROCESSES = int(os.getenv("EMBED_PROCESSES", "0"))
+_executor: ProcessPoolExecutor | None = None
+
+# Seconds a single-query embed waits for concurrent ones to share its encoder
+# pass (0 = encode each query on its own). Off by default: the wait is paid
+# even when no other query arrives, so only enable it under steady load.
+EMBED_BATCH_WINDOW = float(os.getenv("EMBED_BATCH_WINDOW", "0"))
+
 
 def _get_model():
     """Get or create the sentence-transformers model (lazy loaded)."""
     global _model
     if _model is None:
         from sentence_transformers import SentenceTransformer
-        _model = SentenceTransformer(MODEL_NAME)
+        if EMBED_BACKEND == "onnx":
+            try:
+                import onnxruntime as ort
+                import optimum.onnxruntime  # noqa: F401 — sentence-transformers' ONNX backend
+            except ImportError as e:
+                raise RuntimeError(
+                    "EMBED_BACKEND=onnx needs optimum[onnxruntime] "
+                    "(pip install -r backend/requirements-onnx.txt)"
+                ) from e
+            session_options = ort.SessionOptions()
+            session_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            if EMBED_THREADS > 0:
+                session_options.intra_op_num_threads = EMBED_THREADS
+            _model = SentenceTransformer(
+                MODEL_NAME,
+                backend="onnx",
+                model_kwargs={
+                    "file_name": EMBED_ONNX_FILE,
+                    "provider": "CPUExecutionProvider",
+                    "session_options": session_options,
+                },
+            )
+        else:
+            if EMBED_THREADS > 0:
+                import torch
+                torch.set_num_threads(EMBED_THREADS)
+            _model = SentenceTransformer(MODEL_NAME)
     return _model
 
 
-def embed_texts(texts: list[str]) -> list[list[float]]:
-    """Embed a list of texts locally. Used at build time for documents."""
+def embed_texts(texts: list[str]) -> np.ndarray:
+    """Embed a list of texts locally. Used at build time for documents.
+
+    Returns one float32 row per text, kept as a single array (no per-row
+    Python lists); ChromaDB and the QA cache both take it as is.
+    """
     model = _get_model()
     embeddings = model.encode(texts, show_progress_bar=len(texts) > 50, batch_size=64)
-    return [emb.tolist() for emb in embeddings]
+    return np.asarray(embeddings, dtype=np.float32)
+
+
+_TASHKEEL = re.compile(r"[\u064B-\u065F\u0670]")
+_SPACES = re.compile(r"\s+")
+_SPACE_BEFORE_PUNCT = re.compile(r"\s+([؟?!.,،])")
+
+
+def _normalize_query(query: str) -> str:
+    """Fold variants of the same question ("نفقة؟" / " نَفَقة ؟ ") to one string.
+
+    NFKC (Arabic presentation forms → base letters), no tashkeel, single
+    spaces and none before punctuation, lowercase Latin — none of which
+    changes what is being asked.
+    """
+    query = _TASHKEEL.sub("", unicodedata.normalize("NFKC", query))
+    query = _SPACE_BEFORE_PUNCT.sub(r"\1", _SPACES.sub(" ", query))
+    return query.strip().lower()
 
 
-@lru_cache(maxsize=512)
 def embed_query(query: str) -> tuple:
     """Embed a single query. Cached for repeated/similar questions."""
-    model = _get_model()
-    emb = model.encode(query)
-    return tuple(emb.tolist())
+    return _embed_normalized(_normalize_query(query))
+
+
+# Normalized query -> embedding, LRU. An explicit table rather than an
+# lru_cache so embed_queries_async can fill it from batched encodes too.
+_QUERY_CACHE_MAX = 512
+_query_cache: OrderedDict[str, tuple] = OrderedDict()
+_query_cache_lock = threading.Lock()
+
+
+def _cached_embedding(query: str) -> tuple | None:
+    with _query_cache_lock:
+        vector = _query_cache.get(query)
+        if vector is not None:
+            _query_cache.move_to_end(query)
+        return vector
+
+
+def _remember_embedding(query: str, vector: tuple) -> None:
+    with _query_cache_lock:
+        _query_cache[query] = vector
+        _query_cache.move_to_end(query)
+        if len(_query_cache) > _QUERY_CACHE_MAX:
+            _query_cache.popitem(last=False)
+
+
+def _embed_normalized(query: str) -> tuple:
+    vector = _cached_embedding(query)
+    if vector is None:
+        if EMBED_BATCH_WINDOW > 0:
+            vector = tuple(_query_coalescer.embed(query))
+        else:
+            vector = tuple(_get_model().encode(query).tolist())
+        _remember_embedding(query, vector)
+    return vector
+
+
+class _QueryCoalescer:
+    """Joins single-query embeds from concurrent worker threads into one batch.
+
+    The first caller to arrive waits `window` seconds, then encodes every
+    query queued meanwhile in one embed_query_batch call; the others block
+    on their future. retrieve_context and the QA cache run in threads, so
+    simultaneous /api/ask misses share a forward pass.
+    """
+
+    def __init__(self, window: float):
+        self.window = window
+        self._lock = threading.Lock()
+        self._pending: list[tuple[str, Future]] = []
+
+    def embed(self, query: str) -> list[float]:
+        future: Future = Future()
+        with self._lock:
+            self._pending.append((query, future))
+            leader = len(self._pending) == 1
+        if leader:
+            time.sleep(self.window)
+            with self._lock:
+                batch, self._pending = self._pending, []
+            try:
+                vectors = embed_query_batch([q for q, _ in batch])
+            except Exception as e:
+                for _, waiting in batch:
+                    waiting.set_exception(e)
+            else:
+                for (_, waiting), vector in zip(batch, vectors):
+                    waiting.set_result(vector)
+        return future.result()
+
+
+_query_coalescer = _QueryCoalescer(EMBED_BATCH_WINDOW)
+
+
+def embed_query_array(query: str) -> np.ndarray:
+    """Embed a single query as a read-only float32 array (cached, so numpy
+    callers skip the tuple → array conversion on repeat questions)."""
+    return _embed_array(_normalize_query(query))
+
+
+@lru_cache(maxsize=512)
+def _embed_array(query: str) -> np.ndarray:
+    vector = np.asarray(_embed_normalized(query), dtype=np.float32)
+    vector.setflags(write=False)
+    return vector
 
 
 def embed_query_list(query: str) -> list[float]:
     """Embed a single query, returning list (for ChromaDB compatibility)."""
     return list(embed_query(query))
+
+
+def embed_query_batch(queries: list[str]) -> list[list[float]]:
+    """Embed several queries in one encoder pass (for batched ChromaDB search)."""
+    model = _get_model()
+    return [emb.tolist() for emb in model.encode([_normalize_query(q) for q in queries])]
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    """Lazily start the embedding workers; each loads the model once on start."""
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=EMBED_PROCESSES,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_get_model,
+        )
+    return _executor
+
+
+async def embed_query_batch_async(queries: list[str]) -> list[list[float]]:
+    """embed_query_batch without blocking the event loop.
+
+    Runs in the EMBED_PROCESSES worker pool when configured, so the forward
+    pass doesn't compete with the server process for the GIL.
+    """
+    if EMBED_PROCESSES > 0:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_get_executor(), embed_query_batch, queries)
+    return await asyncio.to_thread(embed_query_batch, queries)
+
+
+async def embed_queries_async(queries: list[str]) -> list[list[float]]:
+    """Embed queries through the single-query cache, without blocking the loop.
+
+    Cache hits skip the model; the misses share one embed_query_batch_async
+    pass and are stored, so /api/search and /api/ask reuse each other's
+    embeddings.
+    """
+    normalized = [_normalize_query(q) for q in queries]
+    vectors = {}
+    for query in normalized:
+        vector = _cached_embedding(query)
+        if vector is not None:
+            vectors[query] = vector
+    misses = [query for query in dict.fromkeys(normalized) if query not in vectors]
+    if misses:
+        for query, vector in zip(misses, await embed_query_batch_async(misses)):
+            vectors[query] = tuple(vector)
+            _remember_embedding(query, vectors[query])
+    return [list(vectors[query]) for query in normalized]
+
+
+def shutdown_embed_workers() -> None:
+    """Stop the embedding worker processes, if any were started."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(cancel_futures=True)
+        _executor = None
@@ -5,16 +5,77 @@ This compensates for the multilingual model's weaker Arabic legal term understan
 """
 from __future__ import annotations
 import logging
-from backend.rag.embeddings import embed_query_list
+import re
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+import numpy as np
+
+try:
+    import ahocorasick
+except ImportError:  # fall back to one substring test per keyword
+    ahocorasick = None
+
+from backend.rag.embeddings import embed_query_array, embed_query_list
 from backend.rag.vector_store import search
 from backend.rag.classifier import classify_query
 
 log = logging.getLogger("sanad.pipeline")
 
-# Cache for RAG results (question -> context).
-_rag_cache: dict[str, dict] = {}
+# Cache for RAG results (question -> context), least recently used first.
+# retrieve_context runs in worker threads, so reorders/evictions take the lock.
+_rag_cache: OrderedDict[str, dict] = OrderedDict()
+_rag_cache_lock = threading.Lock()
 _RAG_CACHE_MAX = 128
 
+SEMANTIC_CACHE_THRESHOLD = 0.95  # cosine similarity for reusing another question's search
+_SEMANTIC_CACHE_MAX = 128
+
+
+class _SemanticCache:
+    """Search results of recent questions, found again by embedding similarity.
+
+    Catches paraphrases the exact-text _rag_cache misses ("؟" vs ".", word
+    order). A hit needs cosine >= threshold *and* the same detected topics
+    and top_k, so a near-identical question about a different topic never
+    borrows results. Only the merged search hits are reused; classification,
+    context and sources are rebuilt for the asking question.
+
+    Entries sit in a FIFO ring of unit vectors; at this size one matrix-vector
+    product over all of them is cheaper than LSH bucketing and never misses a
+    neighbour that falls across a bucket boundary.
+    """
+
+    def __init__(self, max_entries: int, threshold: float):
+        self.threshold = threshold
+        self._vectors: np.ndarray | None = None
+        self._entries: list[tuple[tuple, int, dict] | None] = [None] * max_entries
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def get(self, unit: np.ndarray, topics: tuple, top_k: int) -> dict | None:
+        with self._lock:
+            if self._vectors is None:
+                return None
+            similarities = self._vectors @ unit
+            for i in np.flatnonzero(similarities >= self.threshold):
+                entry = self._entries[i]
+                if entry is not None and entry[0] == topics and entry[1] == top_k:
+                    return entry[2]
+        return None
+
+    def put(self, unit: np.ndarray, topics: tuple, top_k: int, merged: dict) -> None:
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((len(self._entries), unit.shape[0]), dtype=np.float32)
+            self._vectors[self._next] = unit
+            self._entries[self._next] = (topics, top_k, merged)
+            self._next = (self._next + 1) % len(self._entries)
+
+
+_semantic_cache = _SemanticCache(_SEMANTIC_CACHE_MAX, SEMANTIC_CACHE_THRESHOLD)
+
 # Legal terms → exact ChromaDB topic names for precise filtering.
 # Longest-match-first: put compound terms before single words.
 # Covers all topics across 5 laws + ضوابط (أحوال شخصية، إثبات، مرافعات، معاملات مدنية، محاكم تجارية، ضوابط الإثبات إلكترونياً).
@@ -526,7 +587,7 @@ def _enrich_followup(question: str, chat_history: list | None) -> str:
     q = question.strip()
 
     # Detect topics from current question
-    detected = _detect_topics(q)
+    detected = _detect_topics(q, limit=2)  # below 2 the list is complete anyway
 
     # If already has 2+ topics, question has enough context on its own
     if detected and len(detected) >= 2:
@@ -618,29 +679,27 @@ def retrieve_context(question: str, top_k: int = 5, chat_history: list | None =
     # Enrich follow-up questions with context from chat history
     enriched_question = _enrich_followup(question, chat_history)
 
-    cache_key = enriched_question.strip()
-    if cache_key in _rag_cache:
-        return _rag_cache[cache_key]
+    # Spelling variants (النفقه / النفقة / النَّفَقة) share one entry
+    cache_key = _normalize_arabic(enriched_question.strip())
+    with _rag_cache_lock:
+        cached = _rag_cache.get(cache_key)
+        if cached is not None:
+            _rag_cache.move_to_end(cache_key)
+            return cached
 
     classification = classify_query(question)  # Classify original question
-    query_embedding = embed_query_list(enriched_question)  # Search with enriched
+    detected_topics = _detect_topics(enriched_question, limit=2)
 
-    # === 1. Broad semantic search (for recall) ===
-    semantic_results = search(query_embedding, n_results=top_k * 2)
+    # Paraphrase of a recent question (same topics) → reuse its search hits
+    vector = embed_query_array(enriched_question)  # Search with enriched
+    norm = float(np.linalg.norm(vector))
+    unit = vector / norm if norm else None
+    merged = _semantic_cache.get(unit, detected_topics, top_k) if unit is not None else None
 
-    # === 2. Keyword-based topic search (for precision) ===
-    detected_topics = _detect_topics(enriched_question)
-    filtered_results = None
-
-    if detected_topics:
-        for topic in detected_topics[:2]:
-            where_filter = {"topic": {"$eq": topic}}
-            filtered_results = search(query_embedding, n_results=top_k, where=where_filter)
-            if filtered_results["documents"] and filtered_results["documents"][0]:
-                break
-
-    # === 3. Merge: topic-matched first (precise), then semantic (broad) ===
-    merged = _merge_results(semantic_results, filtered_results, top_k)
+    if merged is None:
+        merged = _search_and_merge(embed_query_list(enriched_question), detected_topics, top_k)
+        if unit is not None:
+            _semantic_cache.put(unit, detected_topics, top_k, merged)
 
     context = build_context_string(merged, classification)
 
@@ -651,21 +710,41 @@ def retrieve_context(question: str, top_k: int = 5, chat_history: list | None =
         "num_results": len(merged["documents"][0]) if merged["documents"] else 0,
     }
 
-    if len(_rag_cache) >= _RAG_CACHE_MAX:
-        oldest_key = next(iter(_rag_cache))
-        del _rag_cache[oldest_key]
-    _rag_cache[cache_key] = result
+    with _rag_cache_lock:
+        _rag_cache[cache_key] = result
+        if len(_rag_cache) > _RAG_CACHE_MAX:
+            _rag_cache.popitem(last=False)
 
     return result
 
 
+# Tashkeel removed, ة → ه (one str.translate pass). Hamza (أ/إ/آ → ا) and
+# ى → ي are not folded: inside words they turn "مستأجر" into "…تاجر" and
+# "أوصى" into "…وصي", which are different keywords.
+_TASHKEEL = re.compile(r"[\u064B-\u0652\u0670]")
+_ARABIC_FOLD = str.maketrans(
+    {**{chr(c): None for c in range(0x064B, 0x0653)}, "\u0670": None, "ة": "ه"}
+)
+
+
 def _normalize_arabic(text: str) -> str:
-    """Light Arabic normalization for better matching."""
-    # Remove common prefixes/suffixes that block substring matching
-    # Also strip ال التعريف from question for flexible matching
-    import re
-    text = re.sub(r'[إأآا]', 'ا', text)  # Normalize alef variants
-    return text
+    """Light Arabic normalization for keyword matching and the _rag_cache key.
+
+    Questions and keywords are folded, so "النفقه", "النَّفَقة" and "النفقة"
+    hit the same term. The embedder still gets the unfolded question: the
+    stored article vectors were computed from the original spelling
+    (embeddings._normalize_query already drops tashkeel for its own cache).
+    """
+    return text.translate(_ARABIC_FOLD)
+
+
+def _keyword_needle(keyword: str) -> str:
+    """Folded keyword, except keywords written with tashkeel ("طلّق", "أقرّ").
+
+    Those stay as written and only match a question that spells them the
+    same way; folded, "طلّق" would become "طلق" and fire on any mention.
+    """
+    return keyword if _TASHKEEL.search(keyword) else _normalize_arabic(keyword)
 
 
 # Verb/derived forms → topic mapping (handles Arabic morphology)
@@ -774,49 +853,113 @@ LEGAL_VERB_MAP = {
 _SHORT_AMBIGUOUS = {"عرف", "رد", "سند", "دفع", "ركن", "أقر"}
 
 
-def _detect_topics(question: str) -> list[str]:
+def _topic_entries() -> list[tuple[str, re.Pattern | None]]:
+    """(topic, whole-word pattern or None) per keyword, in match-priority order:
+    verb forms first, then LEGAL_TERM_MAP longest term first."""
+    entries = [(topic, None) for topic in LEGAL_VERB_MAP.values()]
+    for term, topic in sorted(LEGAL_TERM_MAP.items(), key=lambda x: len(x[0]), reverse=True):
+        if term in _SHORT_AMBIGUOUS:
+            entries.append((topic, re.compile(r'(?:^|\s)' + re.escape(_normalize_arabic(term)) + r'(?:\s|$)')))
+        else:
+            entries.append((topic, None))
+    return entries
+
+
+def _topic_needles() -> dict[str, tuple[int, ...]]:
+    """Substring → indices into _TOPIC_ENTRIES that it triggers.
+
+    A term beginning with ال (longer than 3 letters) also matches without
+    it. The reverse case ("ال" + term in q) implies term in q, so it needs
+    no needle of its own.
+    """
+    needles: dict[str, list[int]] = {}
+    terms = sorted(LEGAL_TERM_MAP, key=len, reverse=True)
+    for i, verb in enumerate(LEGAL_VERB_MAP):
+        needles.setdefault(_keyword_needle(verb), []).append(i)
+    for i, term in enumerate(terms, start=len(LEGAL_VERB_MAP)):
+        needles.setdefault(_keyword_needle(term), []).append(i)
+        if term not in _SHORT_AMBIGUOUS and len(term) > 3 and term.startswith("ال"):
+            needles.setdefault(_keyword_needle(term[2:]), []).append(i)
+    return {needle: tuple(indices) for needle, indices in needles.items()}
+
+
+_TOPIC_ENTRIES = _topic_entries()
+
+if ahocorasick is not None:
+    _topic_automaton = ahocorasick.Automaton()
+    for _needle, _indices in _topic_needles().items():
+        _topic_automaton.add_word(_needle, _indices)
+    _topic_automaton.make_automaton()
+
+    def _matched_entries(q: str) -> set[int]:
+        return {i for _, indices in _topic_automaton.iter(q) for i in indices}
+else:
+    _TOPIC_NEEDLES = _topic_needles()
+
+    def _matched_entries(q: str) -> set[int]:
+        return {i for needle, indices in _TOPIC_NEEDLES.items() if needle in q for i in indices}
+
+
+@lru_cache(maxsize=512)
+def _detect_topics(question: str, limit: int | None = None) -> tuple[str, ...]:
     """Detect specific legal topics from question keywords (longest match first).
-    Uses both LEGAL_TERM_MAP (noun phrases) and LEGAL_VERB_MAP (verb forms).
+    Uses both LEGAL_TERM_MAP (noun phrases) and LEGAL_VERB_MAP (verb forms);
+    all keywords are found in one Aho–Corasick pass over the question.
+    Keywords and question are compared after _normalize_arabic, so tashkeel
+    and ta marbuta spelling variants still match; keywords written with
+    tashkeel are matched against the question as typed.
+    Cached (follow-ups re-scan the same history messages), so the result is
+    an immutable tuple shared by every caller. With limit, stops after that many topics (search only
+    filters on the first two); history messages still get the full scan.
     """
     topics = []
     seen = set()
-    q = question.strip()
-
-    # 1. Check verb forms first
-    for verb, topic in LEGAL_VERB_MAP.items():
-        if verb in q and topic not in seen:
-            topics.append(topic)
-            seen.add(topic)
-
-    # 2. Sort LEGAL_TERM_MAP by key length descending for longest-match-first
-    sorted_terms = sorted(LEGAL_TERM_MAP.items(), key=lambda x: len(x[0]), reverse=True)
+    raw = question.strip()
+    q = _normalize_arabic(raw)
 
-    for term, topic in sorted_terms:
+    for i in sorted(_matched_entries(q) | _matched_entries(raw)):
+        topic, whole_word = _TOPIC_ENTRIES[i]
         if topic in seen:
             continue
-
         # Short ambiguous words: require word-boundary match (space or start/end)
-        if term in _SHORT_AMBIGUOUS:
-            import re
-            if re.search(r'(?:^|\s)' + re.escape(term) + r'(?:\s|$)', q):
-                topics.append(topic)
-                seen.add(topic)
+        if whole_word is not None and not whole_word.search(q):
             continue
+        topics.append(topic)
+        seen.add(topic)
+        if limit is not None and len(topics) >= limit:
+            break
+
+    return tuple(topics)
 
-        # For regular terms: also try with/without ال prefix for flexibility
-        if term in q:
-            topics.append(topic)
-            seen.add(topic)
-        elif len(term) > 3:
-            # Try adding/removing ال for flexible matching
-            if term.startswith("ال") and term[2:] in q:
-                topics.append(topic)
-                seen.add(topic)
-            elif not term.startswith("ال") and ("ال" + term) in q:
-                topics.append(topic)
-                seen.add(topic)
 
-    return topics
+_NO_RESULTS = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+
+
+def _search_and_merge(query_embedding: list[float], detected_topics: tuple[str, ...], top_k: int) -> dict:
+    """Topic-filtered search (precision) merged with semantic search (recall)."""
+    # === 1. Keyword-based topic search (for precision), both top topics in one query ===
+    filtered_results = None
+    topics = list(detected_topics[:2])
+    if topics:
+        where_filter = {"topic": {"$eq": topics[0]}} if len(topics) == 1 else {"topic": {"$in": topics}}
+        filtered_results = search(query_embedding, n_results=top_k, where=where_filter)
+
+    # === 2. Broad semantic search (for recall), only if the topic hits
+    # don't already fill top_k — merged results would never reach it ===
+    if filtered_results and _distinct_hits(filtered_results) >= top_k:
+        semantic_results = _NO_RESULTS
+    else:
+        semantic_results = search(query_embedding, n_results=top_k * 2)
+
+    # === 3. Merge: topic-matched first (precise), then semantic (broad) ===
+    return _merge_results(semantic_results, filtered_results, top_k)
+
+
+def _distinct_hits(results: dict) -> int:
+    """Hits that _merge_results would keep (distinct ids)."""
+    if not results["documents"] or not results["documents"][0]:
+        return 0
+    return len(set(results["ids"][0]))
 
 
 def _merge_results(semantic: dict, filtered: dict | None, top_k: int) -> dict:
@@ -824,43 +967,30 @@ def _merge_results(semantic: dict, filtered: dict | None, top_k: int) -> dict:
     if not filtered or not filtered["documents"] or not filtered["documents"][0]:
         return _trim(semantic, top_k)
 
-    seen = set()
-    docs, metas, dists = [], [], []
-
-    # Filtered results first (they match the legal topic)
-    for doc, meta, dist in zip(
-        filtered["documents"][0], filtered["metadatas"][0], filtered["distances"][0],
-    ):
-        key = doc[:100]
-        if key not in seen:
-            seen.add(key)
-            docs.append(doc)
-            metas.append(meta)
-            dists.append(dist)
-
-    # Then semantic results (for additional context)
-    if semantic["documents"] and semantic["documents"][0]:
-        for doc, meta, dist in zip(
-            semantic["documents"][0], semantic["metadatas"][0], semantic["distances"][0],
-        ):
-            key = doc[:100]
-            if key not in seen:
-                seen.add(key)
-                docs.append(doc)
-                metas.append(meta)
-                dists.append(dist)
+    # Filtered results first (they match the legal topic), then semantic ones
+    # for additional context. Keyed on the Chroma id (always returned by
+    # query), so a chunk found by both searches counts once; insertion order
+    # keeps filtered first.
+    merged: dict[str, tuple[str, str, dict, float]] = {}
+    for results in (filtered, semantic):
+        if not results["documents"] or not results["documents"][0]:
+            continue
+        for hit in zip(results["ids"][0], results["documents"][0], results["metadatas"][0], results["distances"][0]):
+            merged.setdefault(hit[0], hit)
+            if len(merged) == top_k:
+                break
+        if len(merged) == top_k:
+            break
 
-    return {
-        "documents": [docs[:top_k]],
-        "metadatas": [metas[:top_k]],
-        "distances": [dists[:top_k]],
-    }
+    ids, docs, metas, dists = (list(column) for column in zip(*merged.values())) if merged else ([], [], [], [])
+    return {"ids": [ids], "documents": [docs], "metadatas": [metas], "distances": [dists]}
 
 
 def _trim(results: dict, top_k: int) -> dict:
     if not results["documents"] or not results["documents"][0]:
         return results
     return {
+        "ids": [results["ids"][0][:top_k]],
         "documents": [results["documents"][0][:top_k]],
         "metadatas": [results["metadatas"][0][:top_k]],
         "distances": [results["distances"][0][:top_k]],
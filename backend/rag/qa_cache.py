@@ -8,15 +8,20 @@ import json
 import logging
 import os
 import re
+import time
+from collections import OrderedDict
+from hashlib import blake2b
 
 log = logging.getLogger("sanad.qa_cache")
 
 import numpy as np
+import orjson
 
-from backend.rag.embeddings import embed_texts, embed_query
+from backend.rag.embeddings import embed_query_array, embed_texts
 
 QA_MATCH_THRESHOLD = float(os.getenv("QA_MATCH_THRESHOLD", "0.91"))
 RESPONSE_CACHE_MAX = int(os.getenv("RESPONSE_CACHE_MAX", "256"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))  # seconds
 
 _qa_entries: list[dict] = []
 _qa_embeddings: np.ndarray | None = None
@@ -24,37 +29,56 @@ _qa_index: list[int] = []  # maps embedding row → qa_entry index
 _articles_by_number: dict[str, list[dict]] = {}  # "15_نظام الأحوال الشخصية" → article
 
 # === Response Cache: stores Claude responses for repeated questions ===
-from collections import OrderedDict
-_response_cache: OrderedDict[str, dict] = OrderedDict()
+# key -> (time.monotonic() deadline, response); LRU order, entries expire
+# after RESPONSE_CACHE_TTL
+_response_cache: OrderedDict[bytes, tuple[float, dict]] = OrderedDict()
+
 
+def _cache_key(question: str, model_mode: str, chat_history: list[dict] | None = None) -> bytes:
+    """Hash of the normalized question, model mode and conversation so far.
 
-def _cache_key(question: str, model_mode: str) -> str:
-    """Normalize question for cache key."""
+    Only role and content of each history turn count, so retries of the same
+    conversation hit the cache whatever extra fields the client sends. Both
+    are hashed as strings, whatever JSON type the client sent.
+    """
     q = re.sub(r'[إأآا]', 'ا', question.strip())
     q = re.sub(r'\s+', ' ', q)
-    return f"{model_mode}:{q}"
-
-
-def get_cached_response(question: str, model_mode: str) -> dict | None:
-    """Check if a Claude response is cached for this question."""
-    key = _cache_key(question, model_mode)
-    if key in _response_cache:
-        # Move to end (most recently used)
-        _response_cache.move_to_end(key)
-        log.info("Response cache hit: %s...", key[:60])
-        return _response_cache[key]
-    return None
+    h = blake2b(f"{model_mode}:{q}".encode(), digest_size=16)
+    if chat_history:
+        h.update(b"|")
+        h.update(orjson.dumps([
+            [str(turn.get("role", "")), str(turn.get("content", ""))] for turn in chat_history
+        ]))
+    return h.digest()
+
+
+def get_cached_response(question: str, model_mode: str,
+                        chat_history: list[dict] | None = None) -> dict | None:
+    """Check if a Claude response is cached for this question and history."""
+    key = _cache_key(question, model_mode, chat_history)
+    entry = _response_cache.get(key)
+    if entry is None:
+        return None
+    if entry[0] <= time.monotonic():
+        del _response_cache[key]
+        return None
+    # Move to end (most recently used)
+    _response_cache.move_to_end(key)
+    log.info("Response cache hit: %s...", question[:60])
+    return entry[1]
 
 
 def cache_response(question: str, model_mode: str, response: str,
-                   classification: dict, sources: list) -> None:
+                   classification: dict, sources: list,
+                   chat_history: list[dict] | None = None) -> None:
     """Cache a Claude response for future reuse."""
-    key = _cache_key(question, model_mode)
-    _response_cache[key] = {
+    key = _cache_key(question, model_mode, chat_history)
+    _response_cache[key] = (time.monotonic() + RESPONSE_CACHE_TTL, {
         "answer": response,
         "classification": {**classification, "source": "response_cache"},
         "sources": sources,
-    }
+    })
+    _response_cache.move_to_end(key)
     # Evict oldest if over limit
     while len(_response_cache) > RESPONSE_CACHE_MAX:
         _response_cache.popitem(last=False)
@@ -98,7 +122,7 @@ def initialize_qa_cache():
 
     # Embed all questions at once (batch, local, free)
     raw_embeddings = embed_texts(questions)
-    _qa_embeddings = np.array(raw_embeddings, dtype=np.float32)
+    _qa_embeddings = np.asarray(raw_embeddings, dtype=np.float32)
 
     # Normalize for cosine similarity via dot product
     norms = np.linalg.norm(_qa_embeddings, axis=1, keepdims=True)
@@ -153,8 +177,8 @@ def match_qa_cache(question: str, threshold: float | None = None) -> dict | None
     if threshold is None:
         threshold = QA_MATCH_THRESHOLD
 
-    # Embed the incoming question (cached via lru_cache)
-    query_emb = np.array(embed_query(question), dtype=np.float32)
+    # Embed the incoming question (cached float32 array)
+    query_emb = embed_query_array(question)
     query_norm = np.linalg.norm(query_emb)
     if query_norm == 0:
         return None
@@ -22,15 +22,17 @@ def get_collection():
 
 
 def add_documents(ids: list[str], texts: list[str], embeddings: list[list[float]], metadatas: list[dict]):
-    """Add documents to the vector store."""
+    """Add documents to the vector store (embeddings as lists or a float32 ndarray)."""
     collection = get_collection()
     batch_size = 100
     for i in range(0, len(ids), batch_size):
         end = min(i + batch_size, len(ids))
+        batch = embeddings[i:end]
         collection.add(
             ids=ids[i:end],
             documents=texts[i:end],
-            embeddings=embeddings[i:end],
+            # ndarray rows become lists one batch at a time, never all at once
+            embeddings=batch.tolist() if hasattr(batch, "tolist") else batch,
             metadatas=metadatas[i:end],
         )
 
@@ -48,6 +50,22 @@ def search(query_embedding: list[float], n_results: int = 5, where: dict = None)
     return collection.query(**kwargs)
 
 
+def search_batch(query_embeddings: list[list[float]], n_results: int = 5, where: dict = None) -> dict:
+    """Search for several query embeddings in one ChromaDB call.
+
+    Result lists are indexed per query, in the order given.
+    """
+    collection = get_collection()
+    kwargs = {
+        "query_embeddings": query_embeddings,
+        "n_results": n_results,
+        "include": ["documents", "metadatas", "distances"],
+    }
+    if where:
+        kwargs["where"] = where
+    return collection.query(**kwargs)
+
+
 def get_collection_count() -> int:
     """Get the number of documents in the collection."""
     return get_collection().count()
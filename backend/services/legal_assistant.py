@@ -8,7 +8,7 @@ import asyncio
 import json
 import logging
 import time
-from typing import Generator, Optional
+from typing import AsyncGenerator, Optional
 import anthropic
 
 log = logging.getLogger("sanad.legal_assistant")
@@ -206,10 +206,40 @@ def _get_model_config(model_mode: str = "2.1") -> dict:
         }
 
 
+# One client of each kind per process, created on first use (after gunicorn
+# forks), so requests share the HTTP connection pool and its keep-alives.
+# The async client also serves contract_analyzer and verdict_predictor.
+_client: anthropic.Anthropic | None = None
+_async_client: anthropic.AsyncAnthropic | None = None
+
+
 def get_client() -> anthropic.Anthropic:
+    global _client
+    if not ANTHROPIC_API_KEY:
+        raise ValueError("ANTHROPIC_API_KEY غير مُعَد. أضف المفتاح في ملف .env")
+    if _client is None:
+        _client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
+    return _client
+
+
+def get_async_client() -> anthropic.AsyncAnthropic:
+    global _async_client
     if not ANTHROPIC_API_KEY:
         raise ValueError("ANTHROPIC_API_KEY غير مُعَد. أضف المفتاح في ملف .env")
-    return anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
+    if _async_client is None:
+        _async_client = anthropic.AsyncAnthropic(api_key=ANTHROPIC_API_KEY)
+    return _async_client
+
+
+async def close_clients() -> None:
+    """Close the shared clients' connection pools (app shutdown)."""
+    global _client, _async_client
+    if _async_client is not None:
+        await _async_client.close()
+        _async_client = None
+    if _client is not None:
+        _client.close()
+        _client = None
 
 
 def generate_legal_response(
@@ -285,43 +315,44 @@ def _build_messages(
     return messages
 
 
-def stream_legal_response(
+async def stream_legal_response(
     question: str,
     context: str,
     classification: dict,
     chat_history: Optional[list] = None,
     model_mode: str = "2.1",
-) -> Generator[str, None, None]:
-    """Stream a legal response token-by-token using Claude API."""
-    client = get_client()
+) -> AsyncGenerator[str, None]:
+    """Stream a legal response token-by-token using Claude API.
+
+    Async generator on the async client, so the event loop serves other
+    requests while waiting for the next token.
+    """
+    client = get_async_client()
     config = _get_model_config(model_mode)
     messages = _build_messages(question, context, classification, chat_history)
 
     max_retries = 3
     for attempt in range(max_retries):
         try:
-            with client.messages.stream(
+            async with client.messages.stream(
                 model=CLAUDE_MODEL,
                 max_tokens=config["max_tokens"],
                 system=config["system_prompt"],
                 messages=messages,
             ) as stream:
-                for text in stream.text_stream:
+                async for text in stream.text_stream:
                     yield text
             return  # Success, exit retry loop
         except anthropic.RateLimitError:
             if attempt < max_retries - 1:
                 wait = min(2 ** attempt * 2, 5)  # 2s, 4s, 5s (reduced from 5/10/20)
-                # TODO: Convert stream_legal_response to async generator to use asyncio.sleep
-                # Using blocking sleep here since this is a sync generator; kept short to minimize impact
-                time.sleep(wait)
+                await asyncio.sleep(wait)
             else:
                 raise
         except anthropic.APIStatusError as e:
             if e.status_code == 529 and attempt < max_retries - 1:
                 wait = min(2 ** attempt * 2, 5)  # 2s, 4s, 5s (reduced)
-                # TODO: Convert stream_legal_response to async generator to use asyncio.sleep
-                time.sleep(wait)
+                await asyncio.sleep(wait)
             else:
                 raise
 
@@ -5,14 +5,15 @@ Uses Claude API with RAG-retrieved legal provisions for evidence-based predictio
 """
 from __future__ import annotations
 
+import asyncio
 import logging
 import re
-import time
-from typing import Generator
+from typing import AsyncGenerator
 
 import anthropic
 
-from backend.config import ANTHROPIC_API_KEY, CLAUDE_MODEL
+from backend.config import CLAUDE_MODEL
+from backend.services.legal_assistant import get_async_client
 
 log = logging.getLogger("sanad.verdict_predictor")
 
@@ -300,19 +301,13 @@ CASE_RAG_QUERIES = {
 # Claude streaming prediction
 # ══════════════════════════════════════════════════════════════
 
-def _get_client() -> anthropic.Anthropic:
-    if not ANTHROPIC_API_KEY:
-        raise ValueError("ANTHROPIC_API_KEY غير مُعَد")
-    return anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
-
-
-def stream_verdict_prediction(
+async def stream_verdict_prediction(
     case_text: str,
     context: str,
     case_type: str = "عام",
-) -> Generator[str, None, None]:
-    """Stream verdict prediction token-by-token using Claude API."""
-    client = _get_client()
+) -> AsyncGenerator[str, None]:
+    """Stream verdict prediction token-by-token using Claude API (async client, no worker thread)."""
+    client = get_async_client()
 
     # Truncate very long case details
     max_chars = 10000
@@ -340,26 +335,26 @@ def stream_verdict_prediction(
     max_retries = 3
     for attempt in range(max_retries):
         try:
-            with client.messages.stream(
+            async with client.messages.stream(
                 model=CLAUDE_MODEL,
                 max_tokens=4000,
                 system=SYSTEM_PROMPT_VERDICT,
                 messages=messages,
             ) as stream:
-                for text in stream.text_stream:
+                async for text in stream.text_stream:
                     yield text
             return
         except anthropic.RateLimitError:
             if attempt < max_retries - 1:
                 wait = 2 ** attempt * 5
                 log.warning("Rate limited, retrying in %ds (attempt %d)", wait, attempt + 1)
-                time.sleep(wait)
+                await asyncio.sleep(wait)
             else:
                 raise
         except anthropic.APIStatusError as e:
             if e.status_code == 529 and attempt < max_retries - 1:
                 wait = 2 ** attempt * 5
                 log.warning("API overloaded (529), retrying in %ds", wait)
-                time.sleep(wait)
+                await asyncio.sleep(wait)
             else:
                 raise
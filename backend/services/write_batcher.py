@@ -0,0 +1,86 @@
+"""
+Micro-batched Supabase writes.
+
+Rows submitted within FLUSH_SECONDS of each other (or up to MAX_ROWS of them)
+go to Supabase as one upsert/insert call, run in a worker thread, instead of
+one blocking REST round-trip per request. submit() returns immediately, so
+callers never wait on Supabase; a failed flush is logged, not raised.
+"""
+from __future__ import annotations
+import asyncio
+import logging
+from typing import Optional
+
+from backend.db import get_supabase
+
+log = logging.getLogger("sanad.write_batcher")
+
+FLUSH_SECONDS = 0.05
+MAX_ROWS = 32
+
+
+class WriteBatcher:
+    """Buffers rows for one table and writes them in batches."""
+
+    def __init__(
+        self,
+        table: str,
+        on_conflict: Optional[str] = None,
+        flush_seconds: float = FLUSH_SECONDS,
+        max_rows: int = MAX_ROWS,
+    ):
+        self.table = table
+        self.on_conflict = on_conflict
+        self.flush_seconds = flush_seconds
+        self.max_rows = max_rows
+        self._pending: list[dict] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._running: set[asyncio.Task] = set()
+
+    def submit(self, row: dict) -> None:
+        """Queue a row; it is written within flush_seconds."""
+        self._pending.append(row)
+        if len(self._pending) >= self.max_rows:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.flush_seconds, self._flush)
+
+    async def drain(self) -> None:
+        """Write everything still queued (used on shutdown)."""
+        self._flush()
+        if self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        rows, self._pending = self._pending, []
+        if rows:
+            task = asyncio.get_running_loop().create_task(self._run(rows))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, rows: list[dict]) -> None:
+        if self.on_conflict:
+            # One upsert may not touch the same row twice; the latest submit wins
+            rows = list({row[self.on_conflict]: row for row in rows}.values())
+        try:
+            await asyncio.to_thread(self._write, rows)
+        except Exception as e:
+            log.error("Batched write to %s failed (%d rows): %s", self.table, len(rows), e)
+
+    def _write(self, rows: list[dict]) -> None:
+        sb = get_supabase()
+        if not sb:
+            log.warning("Supabase unavailable — dropped %d %s rows", len(rows), self.table)
+            return
+        table = sb.table(self.table)
+        if self.on_conflict:
+            table.upsert(rows, on_conflict=self.on_conflict).execute()
+        else:
+            table.insert(rows).execute()
+
+
+feedback_batcher = WriteBatcher("message_feedback", on_conflict="message_id")
+analytics_batcher = WriteBatcher("analytics_events")
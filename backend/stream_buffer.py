@@ -0,0 +1,163 @@
+"""
+In-memory buffers for resumable SSE answers.
+
+A Claude answer is produced by a background task into a StreamBuffer, and
+each HTTP connection only replays frames from it. A client that drops
+mid-answer (refresh, flaky mobile network) reconnects with Last-Event-ID
+and continues from the next frame instead of paying for a new generation.
+
+Every frame carries an SSE id line "<stream_id>:<n>". Buffers live in the
+worker process and are dropped STREAM_TTL seconds after they finish.
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from typing import AsyncIterable, AsyncIterator, Optional
+
+STREAM_TTL = 300  # seconds a finished answer stays resumable
+MAX_STREAMS = 256
+TOKEN_BATCH_WINDOW = 0.02  # seconds of Claude tokens merged into one frame
+
+
+class StreamBuffer:
+    """Frames of one streamed answer, readable by any number of followers."""
+
+    def __init__(self, stream_id: str, owner: Optional[str]):
+        self.stream_id = stream_id
+        self.owner = owner
+        self.frames: list[bytes] = []
+        self.done = False
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Condition()
+
+    async def append(self, frame: bytes) -> None:
+        """Add an SSE frame ("data: ...\\n\\n"), prefixed with its id line."""
+        async with self._changed:
+            event_id = f"id: {self.stream_id}:{len(self.frames)}\n".encode()
+            self.frames.append(event_id + frame)
+            self._changed.notify_all()
+
+    async def close(self) -> None:
+        async with self._changed:
+            self.done = True
+            self.finished_at = time.monotonic()
+            self._changed.notify_all()
+
+    async def follow(self, start: int = 0) -> AsyncIterator[bytes]:
+        """Yield frames from index start on, waiting for new ones until closed.
+
+        Frames that piled up since the last wake-up (a slow client, or a
+        replay after Last-Event-ID) go out joined, as one write.
+        """
+        i = start
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: i < len(self.frames) or self.done)
+                pending = self.frames[i:]
+                done = self.done
+            if pending:
+                yield b"".join(pending)
+            i += len(pending)
+            if done and i >= len(self.frames):
+                return
+
+    def resume_index(self, last_event_id: Optional[str]) -> int:
+        """Index of the first frame after Last-Event-ID (0 if absent or foreign)."""
+        prefix = f"{self.stream_id}:"
+        if last_event_id and last_event_id.startswith(prefix):
+            n = last_event_id[len(prefix):]
+            if n.isdigit():
+                return int(n) + 1
+        return 0
+
+
+async def coalesce_tokens(
+    tokens: AsyncIterable[str], window: float = TOKEN_BATCH_WINDOW,
+) -> AsyncIterator[str]:
+    """Re-yield tokens joined into one chunk per window seconds.
+
+    The upstream is drained by its own task, so receiving tokens never waits
+    on framing them, and a fast stream becomes a few frames instead of one
+    per token. An upstream error is raised after the text received before it.
+    """
+    pending: list[str] = []
+    arrived = asyncio.Event()
+
+    async def pump():
+        try:
+            async for token in tokens:
+                pending.append(token)
+                arrived.set()
+        finally:
+            arrived.set()
+
+    task = asyncio.create_task(pump())
+    try:
+        while True:
+            await arrived.wait()
+            if not task.done():
+                await asyncio.sleep(window)
+            arrived.clear()
+            if pending:
+                text = "".join(pending)
+                pending.clear()
+                yield text
+            if task.done() and not pending:
+                task.result()  # re-raise the upstream error, if any
+                return
+    finally:
+        task.cancel()
+
+
+_streams: OrderedDict[str, StreamBuffer] = OrderedDict()
+
+
+def _finished(buf: StreamBuffer) -> bool:
+    """True once no producer can append to buf any more."""
+    return buf.done or (buf.task is not None and buf.task.done())
+
+
+def _evict() -> bool:
+    """Drop expired buffers, then the oldest finished ones if still over MAX_STREAMS.
+
+    Buffers whose answer is still being produced are never dropped. Returns
+    False when every slot holds one of those, i.e. there is no room.
+    """
+    now = time.monotonic()
+    for stream_id in [
+        sid for sid, buf in _streams.items()
+        if buf.done and now - buf.finished_at > STREAM_TTL
+    ]:
+        del _streams[stream_id]
+    if len(_streams) < MAX_STREAMS:
+        return True
+    for stream_id in [sid for sid, buf in _streams.items() if _finished(buf)]:
+        del _streams[stream_id]
+        if len(_streams) < MAX_STREAMS:
+            return True
+    return False
+
+
+def create_stream(owner: Optional[str]) -> StreamBuffer:
+    """Register a new buffer for an answer requested by owner (user id or None).
+
+    With MAX_STREAMS live answers already registered the buffer is returned
+    unregistered: it still feeds the requesting connection, but can't be
+    resumed through get_stream.
+    """
+    buf = StreamBuffer(uuid.uuid4().hex, owner)
+    if _evict():
+        _streams[buf.stream_id] = buf
+    return buf
+
+
+def get_stream(stream_id: str) -> Optional[StreamBuffer]:
+    buf = _streams.get(stream_id)
+    if buf is not None and buf.done and time.monotonic() - buf.finished_at > STREAM_TTL:
+        del _streams[stream_id]
+        return None
+    return buf
@@ -0,0 +1,136 @@
+"""Tests for backend.rag.articles_db — SQLite index behind /api/articles."""
+import os
+import pytest
+import orjson
+from unittest.mock import patch
+
+import backend.rag.articles_db as articles_db
+
+
+def _rebuild(json_path, data):
+    """Rewrite articles.json (newer than articles.db) and run the setup step."""
+    json_path.write_bytes(orjson.dumps(data))
+    mtime = os.path.getmtime(json_path)
+    os.utime(json_path, (mtime + 10, mtime + 10))
+    articles_db.ensure_articles_db()
+
+
+def _article(art_id, chapter, section, topic, text="نص المادة"):
+    return {
+        "id": art_id,
+        "chapter": chapter,
+        "section": section,
+        "topic": topic,
+        "topic_tags": [topic],
+        "text": text,
+    }
+
+
+@pytest.fixture
+def articles_files(tmp_path):
+    """Write a small articles.json and point articles_db at tmp paths."""
+    data = {
+        "total_chunks": 4,
+        "law_name": "نظام الأحوال الشخصية",
+        "structure": {"الباب الأول": "الزواج"},
+        "articles": [
+            _article("a1", "الباب الثاني", "الفصل الأول", "النفقة", "ن" * 400),
+            _article("a2", "الباب الأول", "الفصل الأول", "الخطبة"),
+            _article("a3", "الباب الثاني", "الفصل الثاني", "النسب"),
+            _article("a4", "الباب الثاني", "الفصل الأول", "النفقة"),
+        ],
+    }
+    json_path = tmp_path / "articles.json"
+    db_path = tmp_path / "articles.db"
+    json_path.write_bytes(orjson.dumps(data))
+    with patch.object(articles_db, "ARTICLES_JSON_PATH", str(json_path)), \
+         patch.object(articles_db, "ARTICLES_DB_PATH", str(db_path)):
+        articles_db.ensure_articles_db()
+        yield json_path, db_path
+
+
+class TestArticlesDb:
+    """Tests for the articles.db build and queries."""
+
+    def test_queries_never_build_the_db(self, articles_files):
+        _, db_path = articles_files
+        db_path.unlink()
+        with pytest.raises(FileNotFoundError):
+            articles_db.get_articles_json()
+        assert not db_path.exists()
+
+    def test_setup_skips_fresh_db(self, articles_files):
+        _, db_path = articles_files
+        mtime = os.path.getmtime(db_path)
+        articles_db.ensure_articles_db()
+        assert os.path.getmtime(db_path) == mtime
+
+    def test_meta_round_trips(self, articles_files):
+        meta = articles_db.get_meta()
+        assert meta["total_chunks"] == 4
+        assert meta["structure"] == {"الباب الأول": "الزواج"}
+        assert "articles" not in meta
+
+    def test_articles_keep_file_order(self, articles_files):
+        items, count, total = articles_db.get_articles_json()
+        assert (count, total) == (4, 4)
+        assert [a["id"] for a in orjson.loads(items)] == ["a1", "a2", "a3", "a4"]
+
+    def test_articles_filtered_by_chapter_and_section(self, articles_files):
+        items, _, total = articles_db.get_articles_json(chapter="الباب الثاني", section="الفصل الأول")
+        assert total == 2
+        assert [a["id"] for a in orjson.loads(items)] == ["a1", "a4"]
+
+    def test_articles_paginated(self, articles_files):
+        items, count, total = articles_db.get_articles_json(chapter="الباب الثاني", limit=1, offset=1)
+        assert (count, total) == (1, 3)
+        assert [a["id"] for a in orjson.loads(items)] == ["a3"]
+
+    def test_empty_page(self, articles_files):
+        assert articles_db.get_articles_json(offset=10)[:2] == (b"[]", 0)
+
+    def test_long_text_is_truncated(self, articles_files):
+        first = orjson.loads(articles_db.get_articles_json(limit=1)[0])[0]
+        assert first["text"] == "ن" * 300 + "..."
+        assert first["topic_tags"] == ["النفقة"]
+
+    def test_topic_counts_sorted_by_count(self, articles_files):
+        topics = articles_db.get_topic_counts()
+        assert topics[0] == {"name": "النفقة", "count": 2}
+        # Ties keep file order
+        assert [t["name"] for t in topics[1:]] == ["الخطبة", "النسب"]
+
+    def test_missing_topic_keeps_json_defaults(self, articles_files):
+        json_path, _ = articles_files
+        data = orjson.loads(json_path.read_bytes())
+        del data["articles"][0]["topic"]
+        _rebuild(json_path, data)
+        first = orjson.loads(articles_db.get_articles_json(limit=1)[0])[0]
+        assert first["topic"] == ""
+        assert {"name": "غير محدد", "count": 1} in articles_db.get_topic_counts()
+
+    def test_rebuilt_db_is_reopened(self, articles_files):
+        json_path, _ = articles_files
+        articles_db.get_articles_json()
+        data = orjson.loads(json_path.read_bytes())
+        data["articles"] = data["articles"][:1]
+        _rebuild(json_path, data)
+        assert articles_db.get_articles_json()[1:] == (1, 1)
+
+    def test_topics_json_cached_until_db_rebuilt(self, articles_files):
+        json_path, _ = articles_files
+        first = articles_db.get_topics_json()
+        assert articles_db.get_topics_json() is first
+        assert orjson.loads(first)["topics"][0] == {"name": "النفقة", "count": 2}
+        data = orjson.loads(json_path.read_bytes())
+        data["articles"] = data["articles"][1:2]
+        _rebuild(json_path, data)
+        assert orjson.loads(articles_db.get_topics_json())["topics"] == [{"name": "الخطبة", "count": 1}]
+
+    def test_data_etag_changes_with_json(self, articles_files):
+        json_path, _ = articles_files
+        etag = articles_db.get_data_etag()
+        assert etag.startswith('"') and etag.endswith('"')
+        assert articles_db.get_data_etag() == etag
+        json_path.write_bytes(json_path.read_bytes() + b" ")
+        assert articles_db.get_data_etag() != etag
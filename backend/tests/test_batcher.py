@@ -0,0 +1,80 @@
+"""Tests for backend.rag.batcher — micro-batched /api/search."""
+import asyncio
+from collections import OrderedDict
+import pytest
+from unittest.mock import patch
+
+pytest.importorskip("chromadb")
+
+from backend.rag.batcher import SearchBatcher
+
+
+def _fake_search_batch(embeddings, n_results=5, where=None):
+    """One hit per query whose document echoes the query embedding."""
+    return {
+        "ids": [[f"id-{e[0]}"] for e in embeddings],
+        "documents": [[f"doc-{e[0]}-{n_results}"] for e in embeddings],
+        "metadatas": [[{"topic": (where or {}).get("topic", "")}] for e in embeddings],
+        "distances": [[0.1] for e in embeddings],
+        "embeddings": None,
+    }
+
+
+@pytest.fixture
+def backend_calls():
+    calls = {"embed": [], "search": []}
+
+    def embed(queries):
+        calls["embed"].append(list(queries))
+        return [[q] for q in queries]
+
+    def search(embeddings, n_results=5, where=None):
+        calls["search"].append(len(embeddings))
+        return _fake_search_batch(embeddings, n_results, where)
+
+    with patch("backend.rag.embeddings.embed_query_batch", embed), \
+         patch("backend.rag.embeddings._query_cache", OrderedDict()), \
+         patch("backend.rag.batcher.search_batch", search):
+        yield calls
+
+
+class TestSearchBatcher:
+    """Tests for coalescing concurrent searches."""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_searches_share_one_call(self, backend_calls):
+        batcher = SearchBatcher(flush_seconds=0.01)
+        results = await asyncio.gather(*(batcher.search(q) for q in ["أ", "ب", "ج"]))
+        assert backend_calls["embed"] == [["أ", "ب", "ج"]]
+        assert backend_calls["search"] == [3]
+        assert [r["documents"] for r in results] == [[["doc-أ-5"]], [["doc-ب-5"]], [["doc-ج-5"]]]
+        assert "embeddings" not in results[0]
+
+    @pytest.mark.asyncio
+    async def test_grouped_by_top_k_and_filter(self, backend_calls):
+        batcher = SearchBatcher(flush_seconds=0.01)
+        results = await asyncio.gather(
+            batcher.search("أ", n_results=3),
+            batcher.search("ب", n_results=5),
+            batcher.search("ج", n_results=3),
+        )
+        assert len(backend_calls["embed"]) == 1
+        assert sorted(backend_calls["search"]) == [1, 2]
+        assert results[2]["documents"] == [["doc-ج-3"]]
+
+    @pytest.mark.asyncio
+    async def test_full_batch_flushes_without_waiting(self, backend_calls):
+        batcher = SearchBatcher(flush_seconds=10, max_batch=2)
+        results = await asyncio.wait_for(
+            asyncio.gather(batcher.search("أ"), batcher.search("ب")), 1,
+        )
+        assert len(results) == 2
+
+    @pytest.mark.asyncio
+    async def test_error_reaches_every_caller(self):
+        batcher = SearchBatcher(flush_seconds=0.01)
+        with patch("backend.rag.embeddings.embed_query_batch", side_effect=RuntimeError("model")):
+            results = await asyncio.gather(
+                batcher.search("أ"), batcher.search("ب"), return_exceptions=True,
+            )
+        assert all(isinstance(r, RuntimeError) for r in results)
@@ -193,6 +193,15 @@ class TestClassifyQueryStructure:
         assert isinstance(result["all_categories"], list)
         assert len(result["all_categories"]) > 0
 
+    def test_mutating_result_does_not_touch_cache(self):
+        """Callers get a copy of the cached classification."""
+        first = classify_query("ما هو الطلاق؟")
+        first["intent"] = "changed"
+        first["all_categories"].append("changed")
+        second = classify_query("ما هو الطلاق؟")
+        assert second["intent"] != "changed"
+        assert "changed" not in second["all_categories"]
+
     def test_category_keywords_dict_populated(self):
         """CATEGORY_KEYWORDS should have entries for all major legal areas."""
         expected = ["طلاق", "نفقة", "حضانة", "إرث", "زواج", "مهر", "إثبات", "مرافعات"]
@@ -0,0 +1,73 @@
+"""Tests for backend.rag.embeddings — query normalization and caching."""
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import pytest
+
+from backend.rag import embeddings
+from backend.rag.embeddings import _normalize_query, embed_query
+
+
+class TestNormalizeQuery:
+    """Tests for folding near-duplicate questions."""
+
+    def test_spacing_and_tashkeel_folded(self):
+        assert _normalize_query("  نَفَقة ؟ ") == _normalize_query("نفقة؟") == "نفقة؟"
+
+    def test_latin_lowercased_and_spaces_collapsed(self):
+        assert _normalize_query("Article\t 5 ,") == "article 5,"
+
+
+class TestEmbedQuery:
+    """Tests for the lru_cache in front of the model."""
+
+    def test_variants_share_one_encode(self):
+        model = MagicMock()
+        model.encode.return_value = np.array([0.5, 0.25])
+        with patch.object(embeddings, "_get_model", return_value=model), \
+             patch.object(embeddings, "EMBED_BATCH_WINDOW", 0), \
+             patch.object(embeddings, "_query_cache", embeddings.OrderedDict()):
+            assert embed_query("نفقة؟") == embed_query(" نَفَقة ؟") == (0.5, 0.25)
+        model.encode.assert_called_once_with("نفقة؟")
+
+    @pytest.mark.asyncio
+    async def test_batch_shares_single_query_cache(self):
+        calls = []
+
+        def encode(queries):
+            calls.append(list(queries))
+            return [[float(len(q))] for q in queries]
+
+        with patch.object(embeddings, "embed_query_batch", encode), \
+             patch.object(embeddings, "EMBED_PROCESSES", 0), \
+             patch.object(embeddings, "_query_cache", embeddings.OrderedDict()):
+            embeddings._remember_embedding("نفقة؟", (9.0,))
+            vectors = await embeddings.embed_queries_async([" نَفَقة ؟", "حضانة", "حضانة"])
+            assert vectors == [[9.0], [5.0], [5.0]]
+            assert calls == [["حضانة"]]
+            assert embed_query("حضانة") == (5.0,)
+
+
+class TestQueryCoalescer:
+    """Tests for sharing one encoder pass between threads."""
+
+    def test_concurrent_queries_batched(self):
+        calls = []
+
+        def encode(queries):
+            calls.append(list(queries))
+            return [[float(len(q))] for q in queries]
+
+        coalescer = embeddings._QueryCoalescer(window=0.05)
+        with patch.object(embeddings, "embed_query_batch", encode):
+            with ThreadPoolExecutor(3) as pool:
+                results = list(pool.map(coalescer.embed, ["a", "bb", "ccc"]))
+        assert results == [[1.0], [2.0], [3.0]]
+        assert len(calls) == 1 and sorted(calls[0]) == ["a", "bb", "ccc"]
+
+    def test_error_reaches_every_caller(self):
+        coalescer = embeddings._QueryCoalescer(window=0.0)
+        with patch.object(embeddings, "embed_query_batch", side_effect=RuntimeError("boom")):
+            with pytest.raises(RuntimeError):
+                coalescer.embed("a")
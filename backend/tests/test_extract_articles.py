@@ -0,0 +1,25 @@
+"""Tests for backend.data.extract_articles — cross-reference extraction."""
+import pytest
+
+pytest.importorskip("pypdfium2")
+
+from backend.data.extract_articles import get_related_articles
+
+
+class TestGetRelatedArticles:
+    """Tests for article number references inside article text."""
+
+    @pytest.mark.parametrize("text", [
+        "وفقاً المادة (12) من النظام",
+        "وفقاً المادة 12 من النظام",
+        "عملاً بالمادة (12)",
+        "عملاً بالمادة 12",
+        "خلافاً للمادة (12)",
+        "خلافاً للمادة 12",
+    ])
+    def test_reference_forms(self, text):
+        assert get_related_articles(1, text) == [12]
+
+    def test_own_number_and_out_of_range_skipped(self):
+        text = "المادة (5) وللمادة 300 وبالمادة (7)"
+        assert get_related_articles(5, text) == [7]
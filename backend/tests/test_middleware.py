@@ -1,11 +1,13 @@
 """Tests for backend.middleware — JWT authentication middleware."""
+import time
 import pytest
 from unittest.mock import patch, MagicMock
 from fastapi import FastAPI, Request
 from fastapi.responses import JSONResponse
 from httpx import AsyncClient, ASGITransport
 
-from backend.middleware import JWTAuthMiddleware, PUBLIC_PATHS, verify_jwt_token
+import backend.middleware as middleware
+from backend.middleware import JWTAuthMiddleware, PUBLIC_PATHS, verify_jwt_token, verify_jwt_token_cached
 
 
 # ---------------------------------------------------------------------------
@@ -188,6 +190,105 @@ class TestValidJWT:
                 assert "صلاحية" in resp.json()["detail"]
 
 
+class TestVerifyJWT:
+    """Tests for verify_jwt_token with the legacy HS256 secret."""
+
+    SECRET = b"test-secret-0123456789abcdef0123456789"
+
+    def _token(self, **claims):
+        import jwt as pyjwt
+
+        payload = {"sub": "user-1", "aud": "authenticated", "exp": int(time.time()) + 3600, **claims}
+        return pyjwt.encode(payload, self.SECRET, algorithm="HS256")
+
+    def test_hs256_token_skips_jwks(self):
+        with patch.object(middleware, "_HS256_KEY", self.SECRET), \
+             patch("backend.middleware._get_jwks_client") as mock_jwks:
+            assert verify_jwt_token(self._token())["sub"] == "user-1"
+            mock_jwks.assert_not_called()
+
+    def test_token_without_exp_rejected(self):
+        import jwt as pyjwt
+
+        token = pyjwt.encode({"sub": "user-1", "aud": "authenticated"}, self.SECRET, algorithm="HS256")
+        with patch.object(middleware, "_HS256_KEY", self.SECRET):
+            with pytest.raises(pyjwt.InvalidTokenError):
+                verify_jwt_token(token)
+
+    def test_malformed_header_rejected(self):
+        import jwt as pyjwt
+
+        for token in ("invalid.jwt.token", "", "WzFd.e30.sig"):  # WzFd = "[1]"
+            with pytest.raises(pyjwt.InvalidTokenError):
+                middleware._peek_header(token)
+
+    def test_header_of_verified_token_reused(self):
+        token = self._token()
+        with patch.object(middleware, "_HS256_KEY", self.SECRET), \
+             patch.object(middleware, "_known_headers", {}):
+            verify_jwt_token(token)
+            with patch("backend.middleware._peek_header") as mock_header:
+                assert verify_jwt_token(self._token(sub="user-2"))["sub"] == "user-2"
+                mock_header.assert_not_called()
+
+    def test_es256_key_reused_until_ttl(self):
+        import base64
+        import json
+
+        header = base64.urlsafe_b64encode(json.dumps({"alg": "ES256", "kid": "k1"}).encode()).rstrip(b"=")
+        token = header.decode() + ".e30.sig"
+        jwks = MagicMock()
+        with patch("backend.middleware._get_jwks_client", return_value=jwks), \
+             patch("backend.middleware.jwt.decode", return_value={"sub": "user-1"}), \
+             patch.object(middleware, "_known_headers", {}), \
+             patch.object(middleware, "_es256_keys", {}):
+            verify_jwt_token(token)
+            verify_jwt_token(token)
+            jwks.get_signing_key.assert_called_once_with("k1")
+            with patch("backend.middleware.time.monotonic", return_value=time.monotonic() + middleware.JWKS_KEY_TTL + 1):
+                verify_jwt_token(token)
+            assert jwks.get_signing_key.call_count == 2
+
+
+class TestJWTCache:
+    """Tests for caching verified JWT payloads."""
+
+    @pytest.fixture(autouse=True)
+    def empty_cache(self):
+        with patch.object(middleware, "_jwt_cache", middleware.OrderedDict()):
+            yield
+
+    def test_verified_token_reused(self):
+        payload = {"sub": "user-1", "exp": time.time() + 3600}
+        with patch("backend.middleware.verify_jwt_token", return_value=payload) as mock_verify:
+            assert verify_jwt_token_cached("a.b.c") == payload
+            assert verify_jwt_token_cached("a.b.c") == payload
+            assert mock_verify.call_count == 1
+
+    def test_entry_reverified_after_ttl(self):
+        payload = {"sub": "user-1", "exp": time.time() + 3600}
+        with patch("backend.middleware.verify_jwt_token", return_value=payload) as mock_verify:
+            verify_jwt_token_cached("a.b.c")
+            with patch("backend.middleware.time.time", return_value=time.time() + middleware.JWT_CACHE_TTL + 1):
+                verify_jwt_token_cached("a.b.c")
+            assert mock_verify.call_count == 2
+
+    def test_token_near_expiry_not_cached(self):
+        payload = {"sub": "user-1", "exp": time.time() + 2}
+        with patch("backend.middleware.verify_jwt_token", return_value=payload) as mock_verify:
+            verify_jwt_token_cached("a.b.c")
+            verify_jwt_token_cached("a.b.c")
+            assert mock_verify.call_count == 2
+
+    def test_failed_verification_not_cached(self):
+        import jwt as pyjwt
+
+        with patch("backend.middleware.verify_jwt_token", side_effect=pyjwt.InvalidTokenError("bad")):
+            with pytest.raises(pyjwt.InvalidTokenError):
+                verify_jwt_token_cached("a.b.c")
+        assert len(middleware._jwt_cache) == 0
+
+
 # ===================================================================
 # API key fallback authentication
 # ===================================================================
@@ -252,3 +353,48 @@ class TestAPIKeyAuth:
                     headers={"X-API-Key": "some-key"}
                 )
                 assert resp.status_code == 401
+
+
+# ===================================================================
+# Compression
+# ===================================================================
+
+class TestStreamAwareGZip:
+    """Tests that JSON is gzipped but SSE endpoints are left alone."""
+
+    @staticmethod
+    def _create_app() -> FastAPI:
+        from fastapi.responses import StreamingResponse
+        from backend.middleware import StreamAwareGZipMiddleware
+
+        app = FastAPI()
+        app.add_middleware(StreamAwareGZipMiddleware, minimum_size=100)
+
+        @app.get("/api/big")
+        async def big():
+            return {"text": "نص " * 200}
+
+        @app.get("/api/ask-stream")
+        async def stream():
+            async def gen():
+                for _ in range(50):
+                    yield b'data: {"type":"token","text":"abc"}\n\n'
+            return StreamingResponse(gen(), media_type="text/event-stream")
+
+        return app
+
+    @pytest.mark.asyncio
+    async def test_json_is_gzipped(self):
+        transport = ASGITransport(app=self._create_app())
+        async with AsyncClient(transport=transport, base_url="http://test") as client:
+            resp = await client.get("/api/big", headers={"accept-encoding": "gzip"})
+            assert resp.headers["content-encoding"] == "gzip"
+            assert resp.json()["text"].startswith("نص")
+
+    @pytest.mark.asyncio
+    async def test_stream_not_gzipped(self):
+        transport = ASGITransport(app=self._create_app())
+        async with AsyncClient(transport=transport, base_url="http://test") as client:
+            resp = await client.get("/api/ask-stream", headers={"accept-encoding": "gzip"})
+            assert "content-encoding" not in resp.headers
+            assert resp.text.count("data: ") == 50
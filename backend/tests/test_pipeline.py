@@ -0,0 +1,31 @@
+"""Tests for backend.rag.pipeline — keyword topic detection."""
+import pytest
+
+pytest.importorskip("chromadb")
+
+from backend.rag.pipeline import _detect_topics
+
+
+class TestDetectTopics:
+    """Tests for spelling folds in _detect_topics."""
+
+    def test_tashkeel_and_ta_marbuta_folded(self):
+        assert "النفقة" in _detect_topics("ما هي النَّفَقه؟")
+
+    @pytest.mark.parametrize("question, extra", [
+        ("أنا مستأجر وأريد الخروج", "اختصاص المحكمة التجارية"),
+        ("استأجرت شقة", "اختصاص المحكمة التجارية"),
+        ("أوصى والدي بثلث ماله", "الوصاية"),
+        ("المال الموصى به", "الوصاية"),
+        ("أقر الزوج بالدين", "النسب"),
+        ("إقرار الخصم", "النسب"),
+        ("لا طلق ولا أمسك", "الطلاق"),
+    ])
+    def test_folding_adds_no_topic_from_inside_a_word(self, question, extra):
+        assert extra not in _detect_topics(question)
+
+    def test_longest_term_order_kept(self):
+        assert _detect_topics("متعة المطلقة") == ("المهر", "الطلاق")
+
+    def test_keyword_with_tashkeel_matches_as_typed(self):
+        assert "الطلاق" in _detect_topics("طلّق زوجته")
@@ -0,0 +1,61 @@
+"""Tests for backend.rag.qa_cache — Claude response cache."""
+import time
+import pytest
+from unittest.mock import patch
+
+import backend.rag.qa_cache as qa_cache
+from backend.rag.qa_cache import cache_response, get_cached_response
+
+HISTORY = [
+    {"role": "user", "content": "ما شروط الخلع؟"},
+    {"role": "assistant", "content": "يشترط..."},
+]
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    with patch.object(qa_cache, "_response_cache", qa_cache.OrderedDict()):
+        yield
+
+
+class TestResponseCache:
+    """Tests for response cache keys and eviction."""
+
+    def test_hit_ignores_alef_and_spacing(self):
+        cache_response("ما هي أحكام النفقة", "1.1", "جواب", {"category": "نفقة"}, [])
+        cached = get_cached_response("  ما  هي احكام النفقة ", "1.1")
+        assert cached["answer"] == "جواب"
+        assert cached["classification"]["source"] == "response_cache"
+
+    def test_model_mode_is_part_of_key(self):
+        cache_response("سؤال", "1.1", "جواب", {}, [])
+        assert get_cached_response("سؤال", "2.1") is None
+
+    def test_follow_up_keyed_by_history(self):
+        cache_response("وماذا عن العوض؟", "1.1", "جواب", {}, [], HISTORY)
+        assert get_cached_response("وماذا عن العوض؟", "1.1") is None
+        assert get_cached_response("وماذا عن العوض؟", "1.1", HISTORY[:1]) is None
+        # Extra client-side fields on a turn don't change the key
+        history = [{**turn, "timestamp": 1} for turn in HISTORY]
+        assert get_cached_response("وماذا عن العوض؟", "1.1", history)["answer"] == "جواب"
+
+    def test_least_recently_used_evicted(self):
+        with patch.object(qa_cache, "RESPONSE_CACHE_MAX", 2):
+            cache_response("أ", "1.1", "1", {}, [])
+            cache_response("ب", "1.1", "2", {}, [])
+            get_cached_response("أ", "1.1")
+            cache_response("ج", "1.1", "3", {}, [])
+        assert get_cached_response("ب", "1.1") is None
+        assert get_cached_response("أ", "1.1")["answer"] == "1"
+
+    def test_entry_expires_after_ttl(self):
+        cache_response("سؤال", "1.1", "جواب", {}, [])
+        later = time.monotonic() + qa_cache.RESPONSE_CACHE_TTL + 1
+        with patch("backend.rag.qa_cache.time.monotonic", return_value=later):
+            assert get_cached_response("سؤال", "1.1") is None
+        assert len(qa_cache._response_cache) == 0
+
+    def test_history_with_big_integer_content(self):
+        history = [{"role": "user", "content": 2 ** 70}]
+        cache_response("سؤال", "1.1", "جواب", {}, [], history)
+        assert get_cached_response("سؤال", "1.1", history)["answer"] == "جواب"
@@ -0,0 +1,133 @@
+"""Tests for backend.stream_buffer — resumable SSE answer buffers."""
+import asyncio
+import pytest
+from unittest.mock import patch
+
+import backend.stream_buffer as stream_buffer
+from backend.stream_buffer import StreamBuffer, coalesce_tokens, create_stream, get_stream
+
+
+async def _collect(buf, start=0):
+    return b"".join([chunk async for chunk in buf.follow(start)])
+
+
+class TestStreamBuffer:
+    """Tests for frame ids, replay and live following."""
+
+    @pytest.mark.asyncio
+    async def test_frames_get_sequential_ids(self):
+        buf = StreamBuffer("s1", owner=None)
+        await buf.append(b"data: a\n\n")
+        await buf.append(b"data: b\n\n")
+        await buf.close()
+        assert await _collect(buf) == b"id: s1:0\ndata: a\n\nid: s1:1\ndata: b\n\n"
+
+    @pytest.mark.asyncio
+    async def test_resume_after_last_event_id(self):
+        buf = StreamBuffer("s1", owner=None)
+        for c in "abc":
+            await buf.append(f"data: {c}\n\n".encode())
+        await buf.close()
+        start = buf.resume_index("s1:0")
+        assert await _collect(buf, start) == b"id: s1:1\ndata: b\n\nid: s1:2\ndata: c\n\n"
+
+    def test_resume_index_ignores_foreign_ids(self):
+        buf = StreamBuffer("s1", owner=None)
+        assert buf.resume_index(None) == 0
+        assert buf.resume_index("other:5") == 0
+        assert buf.resume_index("s1:x") == 0
+        assert buf.resume_index("s1:4") == 5
+
+    @pytest.mark.asyncio
+    async def test_follower_receives_live_frames(self):
+        buf = StreamBuffer("s1", owner=None)
+        follower = asyncio.create_task(_collect(buf))
+        await asyncio.sleep(0)
+        await buf.append(b"data: a\n\n")
+        await asyncio.sleep(0)
+        await buf.append(b"data: b\n\n")
+        await buf.close()
+        assert await asyncio.wait_for(follower, 1) == b"id: s1:0\ndata: a\n\nid: s1:1\ndata: b\n\n"
+
+    @pytest.mark.asyncio
+    async def test_backlog_sent_as_one_chunk(self):
+        buf = StreamBuffer("s1", owner=None)
+        for c in "abc":
+            await buf.append(f"data: {c}\n\n".encode())
+        chunks = []
+        async for chunk in buf.follow():
+            chunks.append(chunk)
+            break
+        assert chunks == [b"id: s1:0\ndata: a\n\nid: s1:1\ndata: b\n\nid: s1:2\ndata: c\n\n"]
+
+
+async def _tokens(*tokens, delay=0.0, error=None):
+    for token in tokens:
+        await asyncio.sleep(delay)
+        yield token
+    if error:
+        raise error
+
+
+class TestCoalesceTokens:
+    """Tests for batching Claude tokens into frames."""
+
+    @pytest.mark.asyncio
+    async def test_fast_tokens_merged(self):
+        chunks = [c async for c in coalesce_tokens(_tokens("ال", "نف", "قة"), window=0.05)]
+        assert chunks == ["النفقة"]
+
+    @pytest.mark.asyncio
+    async def test_slow_tokens_kept_apart(self):
+        chunks = [c async for c in coalesce_tokens(_tokens("a", "b", delay=0.05), window=0.001)]
+        assert chunks == ["a", "b"]
+
+    @pytest.mark.asyncio
+    async def test_error_raised_after_received_text(self):
+        chunks = []
+        with pytest.raises(RuntimeError):
+            async for c in coalesce_tokens(_tokens("a", "b", error=RuntimeError("boom")), window=0.01):
+                chunks.append(c)
+        assert "".join(chunks) == "ab"
+
+
+class TestRegistry:
+    """Tests for create_stream / get_stream expiry."""
+
+    @pytest.fixture(autouse=True)
+    def empty_registry(self):
+        with patch.object(stream_buffer, "_streams", stream_buffer.OrderedDict()):
+            yield
+
+    @pytest.mark.asyncio
+    async def test_get_returns_created_stream(self):
+        buf = create_stream(owner="u1")
+        assert get_stream(buf.stream_id) is buf
+        assert get_stream("missing") is None
+
+    @pytest.mark.asyncio
+    async def test_finished_stream_expires(self):
+        buf = create_stream(owner="u1")
+        await buf.close()
+        buf.finished_at -= stream_buffer.STREAM_TTL + 1
+        assert get_stream(buf.stream_id) is None
+
+    @pytest.mark.asyncio
+    async def test_oldest_finished_dropped_over_limit(self):
+        with patch.object(stream_buffer, "MAX_STREAMS", 2):
+            live = create_stream(owner=None)
+            first = create_stream(owner=None)
+            await first.close()
+            create_stream(owner=None)
+        assert get_stream(first.stream_id) is None
+        assert get_stream(live.stream_id) is live
+
+    @pytest.mark.asyncio
+    async def test_live_streams_never_evicted(self):
+        with patch.object(stream_buffer, "MAX_STREAMS", 2):
+            first = create_stream(owner=None)
+            second = create_stream(owner=None)
+            extra = create_stream(owner=None)
+        assert get_stream(first.stream_id) is first
+        assert get_stream(second.stream_id) is second
+        assert get_stream(extra.stream_id) is None
@@ -0,0 +1,51 @@
+"""Tests for backend.services.write_batcher — micro-batched Supabase writes."""
+import asyncio
+import pytest
+from unittest.mock import MagicMock, patch
+
+from backend.services.write_batcher import WriteBatcher
+
+
+@pytest.fixture
+def sb():
+    client = MagicMock()
+    with patch("backend.services.write_batcher.get_supabase", return_value=client):
+        yield client
+
+
+class TestWriteBatcher:
+    """Tests for coalescing rows into one Supabase call."""
+
+    @pytest.mark.asyncio
+    async def test_rows_written_in_one_upsert(self, sb):
+        batcher = WriteBatcher("message_feedback", on_conflict="message_id", flush_seconds=0.01)
+        batcher.submit({"message_id": "a", "rating": "positive"})
+        batcher.submit({"message_id": "b", "rating": "negative"})
+        await asyncio.sleep(0.05)
+        sb.table.assert_called_once_with("message_feedback")
+        rows = sb.table.return_value.upsert.call_args.args[0]
+        assert [r["message_id"] for r in rows] == ["a", "b"]
+
+    @pytest.mark.asyncio
+    async def test_latest_row_wins_per_conflict_key(self, sb):
+        batcher = WriteBatcher("message_feedback", on_conflict="message_id")
+        batcher.submit({"message_id": "a", "rating": "positive"})
+        batcher.submit({"message_id": "a", "rating": "negative"})
+        await batcher.drain()
+        rows = sb.table.return_value.upsert.call_args.args[0]
+        assert rows == [{"message_id": "a", "rating": "negative"}]
+
+    @pytest.mark.asyncio
+    async def test_full_batch_flushes_without_waiting(self, sb):
+        batcher = WriteBatcher("analytics_events", flush_seconds=10, max_rows=2)
+        batcher.submit({"event_type": "x"})
+        batcher.submit({"event_type": "y"})
+        await asyncio.gather(*batcher._running)
+        assert len(sb.table.return_value.insert.call_args.args[0]) == 2
+
+    @pytest.mark.asyncio
+    async def test_write_error_is_logged_not_raised(self, sb):
+        sb.table.return_value.upsert.return_value.execute.side_effect = RuntimeError("down")
+        batcher = WriteBatcher("message_feedback", on_conflict="message_id")
+        batcher.submit({"message_id": "a"})
+        await batcher.drain()
@@ -1,15 +1,26 @@
 """
 Pre-compute embeddings using Gemini API.
-Uses batch_size=10 with 5s delays to respect rate limits.
-765 articles ÷ 10 = ~77 batches × 5s = ~6.5 minutes.
+Uses batch_size=10, with up to CONCURRENCY batches in flight (async client);
+rate-limited batches back off with jittered exponential delays.
 
 Usage: python backend/tools/precompute_gemini.py
 """
+import asyncio
 import json
 import os
+import random
 import sys
 import time
 
+CONCURRENCY = 5  # batches in flight; below the free-tier RPM budget
+BATCH_SIZE = 10
+MAX_ATTEMPTS = 15
+
+
+def _is_rate_limit(err: str) -> bool:
+    return "429" in err or "RATE" in err.upper() or "quota" in err.lower() or "resource" in err.lower()
+
+
 def main():
     project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
     base_dir = os.path.dirname(project_root)
@@ -56,58 +67,20 @@ def main():
         print("✅ Done!")
         return
 
-    batch_size = 10
-    delay = 5  # seconds between batches
-    total_batches = (len(missing) + batch_size - 1) // batch_size
+    total_batches = (len(missing) + BATCH_SIZE - 1) // BATCH_SIZE
     start_time = time.time()
 
-    for i in range(0, len(missing), batch_size):
-        batch = missing[i:i+batch_size]
-        texts = [a["text"] for a in batch]
-        batch_num = i // batch_size + 1
-
-        for attempt in range(15):
-            try:
-                result = client.models.embed_content(
-                    model="gemini-embedding-001",
-                    contents=texts,
-                    config={"output_dimensionality": 768},
-                )
-                for article, emb in zip(batch, result.embeddings):
-                    existing[article["id"]] = emb.values
-
-                # Save after each batch
-                with open(embeddings_path, "w") as f:
-                    json.dump(existing, f)
-
-                elapsed = time.time() - start_time
-                pct = len(existing) / total * 100
-                eta = (elapsed / max(batch_num, 1)) * (total_batches - batch_num)
-                print(f"  [{batch_num}/{total_batches}] {len(existing)}/{total} ({pct:.0f}%) — ETA {eta:.0f}s")
-                sys.stdout.flush()
-                break
-
-            except Exception as e:
-                err = str(e)
-                if "429" in err or "RATE" in err.upper() or "quota" in err.lower() or "resource" in err.lower():
-                    wait = min(2 ** attempt * 5, 60)
-                    print(f"  ⏳ Rate limit batch {batch_num}, wait {wait}s (attempt {attempt+1}/15)...")
-                    sys.stdout.flush()
-                    time.sleep(wait)
-                else:
-                    print(f"  ❌ Error: {e}")
-                    with open(embeddings_path, "w") as f:
-                        json.dump(existing, f)
-                    raise
-        else:
-            print(f"Failed after 15 attempts. Saved {len(existing)}.")
-            with open(embeddings_path, "w") as f:
-                json.dump(existing, f)
-            sys.exit(1)
-
-        # Delay between batches
-        if i + batch_size < len(missing):
-            time.sleep(delay)
+    def save():
+        with open(embeddings_path, "w") as f:
+            json.dump(existing, f)
+
+    try:
+        asyncio.run(_embed_missing(client, missing, existing, total, total_batches, start_time, save))
+    except RuntimeError as e:
+        print(f"{e}. Saved {len(existing)}.")
+        sys.exit(1)
+    finally:
+        save()
 
     elapsed = time.time() - start_time
     print(f"\n✅ All {len(existing)} embeddings saved in {elapsed:.0f}s!")
@@ -115,5 +88,51 @@ def main():
     print(f"   Size: {size_mb:.1f} MB")
 
 
+async def _embed_missing(client, missing, existing, total, total_batches, start_time, save):
+    """Embed all missing articles, CONCURRENCY batches at a time."""
+    limit = asyncio.Semaphore(CONCURRENCY)
+    done = 0
+
+    async def run_batch(batch_num, batch):
+        nonlocal done
+        texts = [a["text"] for a in batch]
+        async with limit:
+            for attempt in range(MAX_ATTEMPTS):
+                try:
+                    result = await client.aio.models.embed_content(
+                        model="gemini-embedding-001",
+                        contents=texts,
+                        config={"output_dimensionality": 768},
+                    )
+                    break
+                except Exception as e:
+                    if not _is_rate_limit(str(e)):
+                        print(f"  ❌ Error: {e}")
+                        raise
+                    wait = min(random.uniform(0.5, 1.5) * 2 ** attempt, 60)
+                    print(f"  ⏳ Rate limit batch {batch_num}, wait {wait:.1f}s (attempt {attempt+1}/{MAX_ATTEMPTS})...")
+                    sys.stdout.flush()
+                    await asyncio.sleep(wait)
+            else:
+                raise RuntimeError(f"Batch {batch_num} failed after {MAX_ATTEMPTS} attempts")
+
+        for article, emb in zip(batch, result.embeddings):
+            existing[article["id"]] = emb.values
+        # Save after each batch (single thread, so no write races)
+        save()
+
+        done += 1
+        elapsed = time.time() - start_time
+        pct = len(existing) / total * 100
+        eta = (elapsed / done) * (total_batches - done)
+        print(f"  [{done}/{total_batches}] {len(existing)}/{total} ({pct:.0f}%) — ETA {eta:.0f}s")
+        sys.stdout.flush()
+
+    await asyncio.gather(*(
+        run_batch(i // BATCH_SIZE + 1, missing[i:i + BATCH_SIZE])
+        for i in range(0, len(missing), BATCH_SIZE)
+    ))
+
+
 if __name__ == "__main__":
     main()
@@ -15,6 +15,7 @@ project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, os.path.dirname(project_root))
 
 from backend.config import ARTICLES_JSON_PATH, CHROMA_PERSIST_DIR
+from backend.rag.articles_db import ensure_articles_db
 from backend.rag.vector_store import add_documents, get_collection_count
 
 EMBEDDINGS_PATH = os.path.join(os.path.dirname(ARTICLES_JSON_PATH), "embeddings.json")
@@ -42,6 +43,9 @@ def setup_database(force_rebuild: bool = False):
     total = len(articles)
     print(f"تم تحميل {total} مقطع")
 
+    # SQLite index behind /api/articles — the server only opens it read-only
+    ensure_articles_db()
+
     # Check existing state
     existing_count = get_collection_count()
 